@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#   Copyright 2025 hidenorly
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from mountainRecordUtil import JsonCache, HtmlUtil
+from check_parser_parity import FIXTURES, PARSER_KINDS, loadFixture
+
+DEFAULT_BASELINE_PATH = os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, "parserBenchmark", "baseline.json")
+DEFAULT_ITERATIONS = 20
+DEFAULT_THRESHOLD = 0.7 # fails if pages/s drops below (or peak memory grows above) the baseline by this ratio
+
+HTML_PARSE_FIELD = "(html parse)"
+OTHER_FIELD = "(other)"
+RECORDS_FIELD = "(records)"
+
+class FieldTimer:
+	# the time since the previous field access is accounted to the accessed field since the parsers fill the fields one by one
+	def __init__(self):
+		self.times = {}
+		self.last = time.perf_counter()
+
+	def mark(self, field):
+		now = time.perf_counter()
+		self.times[field] = self.times.get(field, 0) + now - self.last
+		self.last = now
+
+class TimedDict(dict):
+	def __init__(self, base, timer):
+		super().__init__(base)
+		self._timer = timer
+
+	def __setitem__(self, key, value):
+		self._timer.mark(key)
+		super().__setitem__(key, value)
+
+	def __getitem__(self, key):
+		value = super().__getitem__(key)
+		if isinstance(value, list):
+			# list fields are appended in place
+			self._timer.mark(key)
+		return value
+
+class TimedList(list):
+	def __init__(self, base, timer):
+		super().__init__(base)
+		self._timer = timer
+
+	def append(self, value):
+		self._timer.mark(RECORDS_FIELD)
+		super().append(value)
+
+def parseWithTimer(fixture, text, timer):
+	kind, parserClass, url = FIXTURES[fixture]
+	getBaseResult, extract = PARSER_KINDS[kind]
+	parser = parserClass()
+	timer.last = time.perf_counter()
+	soup = HtmlUtil.parse(text, parser.PARSE_ONLY)
+	timer.mark(HTML_PARSE_FIELD)
+	result = getBaseResult(parser, url)
+	result = TimedDict(result, timer) if isinstance(result, dict) else TimedList(result, timer)
+	result = extract(parser, soup, result)
+	timer.mark(OTHER_FIELD)
+	return result
+
+def benchmark(fixture, text, iterations):
+	timer = FieldTimer()
+	parseWithTimer(fixture, text, FieldTimer()) # warm up
+
+	start = time.perf_counter()
+	for i in range(iterations):
+		parseWithTimer(fixture, text, timer)
+	elapsed = time.perf_counter() - start
+
+	tracemalloc.start()
+	parseWithTimer(fixture, text, FieldTimer())
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return {
+		"pagesPerSec": iterations / elapsed if elapsed else 0,
+		"peakKB": peak / 1024,
+		"fieldMs": { field: value * 1000 / iterations for field, value in timer.times.items() },
+	}
+
+def getRegressions(key, result, baseline, threshold):
+	regressions = []
+	if key in baseline:
+		base = baseline[key]
+		if result["pagesPerSec"] < base["pagesPerSec"] * threshold:
+			regressions.append(f"pages/s {result['pagesPerSec']:.1f} < {base['pagesPerSec']:.1f}*{threshold}")
+		if result["peakKB"] > base["peakKB"] / threshold:
+			regressions.append(f"peak {result['peakKB']:.0f}KB > {base['peakKB']:.0f}KB/{threshold}")
+	return regressions
+
+def loadBaseline(path):
+	try:
+		with open(path, encoding="utf-8") as f:
+			return json.load(f)
+	except:
+		return {}
+
+def saveBaseline(path, baseline):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump(baseline, f, indent=2)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmark the parsers on the offline fixtures (pages/s, peak memory and per-field extraction time)')
+	parser.add_argument('args', nargs='*', help='fixture filenames (default:all)')
+	parser.add_argument('-b', '--backend', action='store', default=None, help='html parser backend (lxml|html.parser). default:html.parser')
+	parser.add_argument('-s', '--strainer', action='store_true', default=False, help='Build only the subtrees which the parser reads')
+	parser.add_argument('-n', '--iterations', action='store', default=DEFAULT_ITERATIONS, type=int, help='Number of parses per fixture')
+	parser.add_argument('-f', '--fields', action='store_true', default=False, help='Show per-field extraction time')
+	parser.add_argument('-t', '--threshold', action='store', default=DEFAULT_THRESHOLD, type=float, help='Fail if pages/s is below baseline*threshold or peak memory is above baseline/threshold')
+	parser.add_argument('--baseline', action='store', default=DEFAULT_BASELINE_PATH, help='Baseline file')
+	parser.add_argument('--saveBaseline', action='store_true', default=False, help='Save the results as the baseline (the ones without the baseline are always saved)')
+	args = parser.parse_args()
+
+	HtmlUtil.configure(parser=args.backend, useStrainer=args.strainer)
+	backend = f"{HtmlUtil.getParser()}{'+strainer' if args.strainer else ''}"
+
+	baseline = loadBaseline(args.baseline)
+	fixtures = [os.path.basename(aFixture) for aFixture in args.args] if args.args else FIXTURES.keys()
+	isFailed = False
+	isBaselineUpdated = False
+	for aFixture in fixtures:
+		result = benchmark(aFixture, loadFixture(aFixture), args.iterations)
+		key = f"{aFixture}:{backend}"
+		regressions = getRegressions(key, result, baseline, args.threshold)
+		if regressions:
+			isFailed = True
+		# no baseline on this machine yet then this run only records it
+		status = "NG" if regressions else ("OK" if key in baseline else "BASE")
+		print(f"{status} {aFixture} {backend} {result['pagesPerSec']:.1f} pages/s peak {result['peakKB']:.0f}KB{' : '+', '.join(regressions) if regressions else ''}")
+		if args.fields:
+			for field, ms in sorted(result["fieldMs"].items(), key=lambda x: x[1], reverse=True):
+				print(f"  {field}: {ms:.3f} ms")
+		if args.saveBaseline or not key in baseline:
+			baseline[key] = { "pagesPerSec": result["pagesPerSec"], "peakKB": result["peakKB"] }
+			isBaselineUpdated = True
+
+	if isBaselineUpdated:
+		saveBaseline(args.baseline, baseline)
+		if not args.saveBaseline:
+			print(f"No baseline for the BASE ones. Their results are saved to {args.baseline} and the later runs are checked against them")
+
+	sys.exit(1 if isFailed else 0)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#   Copyright 2026 hidenorly
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from generate_mountain_db import OsrmRouter, RouteTimeCache, RouteTimeResolver, distance_meter
+
+ORIGIN = (35.681, 139.767)
+SPEED_METER_PER_SEC = 40 * 1000 / 3600
+
+class StandInRouterHandler(BaseHTTPRequestHandler):
+	# OSRM compatible /table/v1/<profile>/<lon,lat;...>?sources=0 with the straight distance at the constant speed
+	latency = 0.02
+	requests = 0
+	lock = threading.Lock()
+
+	def do_GET(self):
+		with StandInRouterHandler.lock:
+			StandInRouterHandler.requests += 1
+		time.sleep(StandInRouterHandler.latency)
+
+		path = urlsplit(self.path).path
+		coordinates = [ [float(x) for x in aPoint.split(",")] for aPoint in path.split("/")[-1].split(";") ]
+		origin_lon, origin_lat = coordinates[0]
+		durations = [ distance_meter(origin_lat, origin_lon, lat, lon) / SPEED_METER_PER_SEC for lon, lat in coordinates ]
+
+		body = json.dumps({"code": "Ok", "durations": [durations]}).encode()
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+class PerPointRouter:
+	# the same router without the table query as get_route_time.py
+	supports_batch = False
+
+	def __init__(self, router):
+		self.router = router
+
+	def get_id(self):
+		return self.router.get_id()
+
+	def get_route_time(self, lat, lon):
+		return self.router.get_route_time(lat, lon)
+
+def getTrailheads(numOfMountains, trailheadsPerMountain, nearRatio, seed = 1):
+	# trailheads of a mountain are close to each other. some of them are within the tolerance of the other one
+	random.seed(seed)
+	result = []
+	for i in range(numOfMountains):
+		lat = 35.0 + random.random() * 2
+		lon = 138.0 + random.random() * 2
+		mountain = []
+		for j in range(trailheadsPerMountain):
+			if mountain and random.random() < nearRatio:
+				_lat, _lon = random.choice(mountain)
+				mountain.append( (_lat + random.uniform(-0.0005, 0.0005), _lon + random.uniform(-0.0005, 0.0005)) )
+			else:
+				mountain.append( (lat + random.uniform(-0.05, 0.05), lon + random.uniform(-0.05, 0.05)) )
+		result.append(mountain)
+	return result
+
+def run(name, resolver, mountains):
+	StandInRouterHandler.requests = 0
+	start = time.perf_counter()
+	n = 0
+	for aMountain in mountains:
+		n += len([ x for x in resolver.resolve(aMountain) if x is not None ])
+	elapsed = time.perf_counter() - start
+	print(f"{name:28} {elapsed:8.3f} sec  {StandInRouterHandler.requests:5} router requests  {resolver.stats['cache_hit']:5} cache hits  {n} resolved")
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmark the route time resolver with a local stand-in router')
+	parser.add_argument('-m', '--mountains', action='store', default=50, type=int, help='Number of mountains')
+	parser.add_argument('-t', '--trailheads', action='store', default=6, type=int, help='Number of trailhead clusters per mountain')
+	parser.add_argument('-r', '--nearRatio', action='store', default=0.3, type=float, help='Ratio of the trailheads near the other one')
+	parser.add_argument('-l', '--latency', action='store', default=0.02, type=float, help='Latency [sec] of the stand-in router per request')
+	parser.add_argument('--tolerance', action='store', default=300, type=float, help='Tolerance [m] of the route time cache')
+	args = parser.parse_args()
+
+	StandInRouterHandler.latency = args.latency
+	server = ThreadingHTTPServer(("127.0.0.1", 0), StandInRouterHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	router = OsrmRouter(f"http://127.0.0.1:{server.server_address[1]}", *ORIGIN)
+	mountains = getTrailheads(args.mountains, args.trailheads, args.nearRatio)
+
+	with tempfile.TemporaryDirectory() as tmpDir:
+		cachePath = os.path.join(tmpDir, "route_time.json")
+		run("per trailhead", RouteTimeResolver(PerPointRouter(router)), mountains)
+		run("per trailhead + cache", RouteTimeResolver(PerPointRouter(router), RouteTimeCache(cachePath + ".1", args.tolerance)), mountains)
+
+		cache = RouteTimeCache(cachePath, args.tolerance)
+		run("batch + cache", RouteTimeResolver(router, cache), mountains)
+		cache.save()
+		run("batch + cache (next run)", RouteTimeResolver(router, RouteTimeCache(cachePath, args.tolerance)), mountains)
+
+	server.shutdown()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# coding: utf-8
+#   Copyright 2025 hidenorly
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import json
+import os
+import sys
+from mountainRecordUtil import HtmlUtil
+from get_detail_record import YamarecoParser, YamapParser, MountainDetailRecordUtil
+from get_recent_record2 import MountainRecordUtilYamareco, MountainRecordUtilYamap
+from get_mountain_info import MountainInfoUtilYamareco, MountainInfoUtilYamap
+
+# hand-written synthetic pages which mimic the markup the parsers read. they aren't recorded from the sites
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testdata", "html")
+
+# (parser, useStrainer). The 1st one is the reference
+BACKENDS = [
+	(HtmlUtil.PARSER_HTML, False),
+	(HtmlUtil.PARSER_HTML, True),
+	(HtmlUtil.PARSER_LXML, False),
+	(HtmlUtil.PARSER_LXML, True),
+]
+
+# kind : (base result, extract fields from the soup)
+PARSER_KINDS = {
+	"detail": (lambda parser, url: MountainDetailRecordUtil.createBaseResult(url), lambda parser, soup, result: parser.parseRecentRecord(soup, result)),
+	"recent": (lambda parser, url: [], lambda parser, soup, result: parser._parseRecentRecord(soup, result)),
+	"info": (lambda parser, url: parser._getBaseResult(), lambda parser, soup, result: parser._parseMountainInfo(soup, result)),
+}
+
+# fixture filename : (kind, parser, url of the page)
+FIXTURES = {
+	"yamareco_detail_record.html": ("detail", YamarecoParser, "https://www.yamareco.com/modules/yamareco/detail-1234567.html"),
+	"yamareco_recent_record.html": ("recent", MountainRecordUtilYamareco, "https://www.yamareco.com/modules/yamainfo/ptinfo.php?ptid=1"),
+	"yamareco_mountain_info.html": ("info", lambda: MountainInfoUtilYamareco(None), "https://www.yamareco.com/modules/yamainfo/ptinfo.php?ptid=1"),
+	"yamap_detail_record.html": ("detail", YamapParser, "https://yamap.com/activities/40000001"),
+	"yamap_recent_record.html": ("recent", MountainRecordUtilYamap, "https://yamap.com/mountains/1234"),
+	"yamap_mountain_info.html": ("info", lambda: MountainInfoUtilYamap(None), "https://yamap.com/mountains/1234"),
+}
+
+def loadFixture(fixture):
+	with open(os.path.join(FIXTURE_DIR, os.path.basename(fixture)), encoding="utf-8") as f:
+		return f.read()
+
+def parseFixture(fixture, text):
+	kind, parserClass, url = FIXTURES[os.path.basename(fixture)]
+	getBaseResult, extract = PARSER_KINDS[kind]
+	parser = parserClass()
+	soup = HtmlUtil.parse(text, parser.PARSE_ONLY)
+	return extract(parser, soup, getBaseResult(parser, url))
+
+def toComparable(result):
+	return json.loads(json.dumps(result, ensure_ascii=False, default=str))
+
+def getDiffFields(expected, actual):
+	result = []
+	if isinstance(expected, dict) and isinstance(actual, dict):
+		for key in sorted(set(expected.keys()) | set(actual.keys())):
+			if expected.get(key) != actual.get(key):
+				result.append(key)
+	elif expected != actual:
+		result.append("*")
+	return result
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Check the parsers extract the identical fields from the fixtures with each html parsing backend')
+	parser.add_argument('args', nargs='*', help='fixture filenames (default:all)')
+	parser.add_argument('-v', '--verbose', action='store_true', default=False, help='dump the extracted fields')
+	args = parser.parse_args()
+
+	fixtures = args.args if args.args else FIXTURES.keys()
+	isFailed = False
+	for aFixture in fixtures:
+		text = loadFixture(aFixture)
+
+		expected = None
+		for backend, useStrainer in BACKENDS:
+			HtmlUtil.configure(parser=backend, useStrainer=useStrainer)
+			if HtmlUtil.getParser() != backend:
+				print(f"SKIP {aFixture} {backend} (not installed)")
+				continue
+			result = toComparable(parseFixture(aFixture, text))
+			if expected is None:
+				expected = result
+				if args.verbose:
+					print(json.dumps(result, ensure_ascii=False, indent=2))
+			diffFields = getDiffFields(expected, result)
+			status = "OK" if not diffFields and result else "NG"
+			if status != "OK":
+				isFailed = True
+			print(f"{status} {aFixture} {backend}{' +strainer' if useStrainer else ''}{' '+','.join(diffFields) if diffFields else ''}")
+
+	sys.exit(1 if isFailed else 0)
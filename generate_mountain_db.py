@@ -23,8 +23,14 @@ from collections import defaultdict
 import os
 import time
 import copy
-import importlib.util
-import pprint
+import json
+import threading
+import urllib.request
+from datetime import datetime
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from mountain_db_store import load_db, save_db
 
 TOZANGUCHI = os.path.expanduser("~/bin/get_tozanguchi.py")
 ROUTE_TIME = os.path.expanduser("~/work/routeTime/get_route_time.py")
@@ -32,8 +38,31 @@ MOUNTAIN_INFO = os.path.expanduser("~/bin/get_mountain_info.py")
 RECENT_RECORD = os.path.expanduser("~/bin/get_recent_record2.py")
 DETAIL_RECORD = os.path.expanduser("~/bin/get_detail_record.py")
 
+# call get_mountain_info, get_recent_record2 and get_detail_record in this process instead of spawning python3.
+# falls back to the subprocess if they can't be imported
+USE_IN_PROCESS = True
+IN_PROCESS_PROVIDER = "yamareco"
+
 NEAR_DISTANCE_METER = 200
-WAIT_SECONDS_PER_MOUNTAIN = 15
+# sort the records before clustering and snap the trailhead ids to the grid then the runs give the same trailheads
+CLUSTER_ORDER_INDEPENDENT = False
+TRAILHEAD_ID_GRID_METER = 50
+
+# the mountains and the detail records of a mountain are fetched concurrently within the requests per second budget of each host
+DEFAULT_REQUESTS_PER_SEC = {
+    "yamareco.com": 1.0,
+    "yamap.com": 1.0,
+}
+DEFAULT_MOUNTAIN_JOBS = 4
+DEFAULT_DETAIL_JOBS = 4
+
+TOZANGUCHI_CACHE_NUM = 3000
+
+# the drive time to a trailhead within the tolerance of a known one is reused
+ROUTE_TIME_CACHE_DIR = os.path.expanduser("~/.cache/routeTime")
+DEFAULT_ROUTE_TIME_TOLERANCE_METER = 300
+ROUTE_TIME_CACHE_EXPIRE_DAYS = 90
+ROUTE_TIME_CACHE_MAX_ENTRIES = 50000 # the newest ones are kept
 # TODO: add hinting info. for the trail heads
 VERTICAL_ROUTE_KEYWORDS = [
     "縦走",
@@ -47,15 +76,232 @@ def run(cmd):
     return subprocess.check_output(cmd, shell=True, text=True)
 
 
-def load_py_variable(filename, varname):
-    if not filename or not os.path.exists(filename):
-        return {}
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.last) * self.rate,
+                )
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    # a token bucket per domain. the hosts out of the domains aren't limited but counted
+    def __init__(self, requests_per_sec):
+        self.buckets = {
+            domain: TokenBucket(rate)
+            for domain, rate in requests_per_sec.items()
+            if rate and rate > 0
+        }
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def get_domain(self, url):
+        host = urlparse(url).netloc or url
+
+        for domain in self.buckets:
+            if host == domain or host.endswith("." + domain):
+                return domain
+
+        return host
+
+    def acquire(self, url):
+        domain = self.get_domain(url)
+
+        bucket = self.buckets.get(domain)
+        if bucket:
+            bucket.acquire()
+
+        with self.lock:
+            self.counts[domain] += 1
 
-    spec = importlib.util.spec_from_file_location("db", filename)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    def get_counts(self):
+        with self.lock:
+            return dict(self.counts)
 
-    return copy.deepcopy(getattr(module, varname, {}))
+
+_rate_limiter = None
+
+def acquire_rate_limit(url):
+    if _rate_limiter:
+        _rate_limiter.acquire(url)
+
+
+class InProcessPipeline:
+    # same results as the *_by_subprocess() but the structured dicts are passed without the interpreter startup per url
+    def __init__(self):
+        from get_mountain_info import MountainInfo
+        from get_recent_record2 import MountainRecordUtil, MountainFilterUtil
+        from get_detail_record import MountainDetailRecordUtil
+        from mountainRecordUtil import HttpUtil
+
+        self.http_util = HttpUtil
+        self.mountain_info = MountainInfo()
+        self.record_util = MountainRecordUtil()
+        self.filter_util = MountainFilterUtil
+        self.detail_record_util = MountainDetailRecordUtil
+
+    def set_rate_limiter(self, rate_limiter):
+        # every request of the parsers goes through HttpUtil
+        self.http_util.configure(rateLimiter=rate_limiter)
+
+    def parse_mountain_info(self, name):
+        result = []
+        try:
+            infos = self.mountain_info.getWithCondition([name])
+        except:
+            return result
+
+        for info in infos.get(name, []):
+            url = info.get("url")
+            if not url or IN_PROCESS_PROVIDER not in url:
+                continue
+
+            name_value = str(info.get("name") or "").strip()
+            yomi = str(info.get("yomi") or "").strip()
+            # parsed as same as the text output of get_mountain_info.py then the mountain uuids stay stable
+            alt_match = re.match(r"\s*([\d\.]+)", str(info.get("altitude") or ""))
+            loc_match = re.search(
+                r"北緯(\d+)度(\d+)分(\d+)秒,\s*東経(\d+)度(\d+)分(\d+)秒",
+                str(info.get("location") or "")
+            )
+            if not all([name_value, yomi, alt_match, loc_match]):
+                continue
+
+            lat = dms_to_decimal(
+                int(loc_match.group(1)),
+                int(loc_match.group(2)),
+                int(loc_match.group(3)),
+            )
+            lon = dms_to_decimal(
+                int(loc_match.group(4)),
+                int(loc_match.group(5)),
+                int(loc_match.group(6)),
+            )
+            categories = [
+                x.strip()
+                for x in info.get("category", [])
+                if x and x.strip()
+            ]
+
+            result.append(
+                to_mountain_info(name_value, yomi, float(alt_match.group(1)), lat, lon, url.strip(), categories)
+            )
+
+        return result
+
+    def parse_recent_records(self, name, days, samples):
+        grouped = defaultdict(list)
+        today = datetime.now().date()
+
+        mountains = [
+            mountain
+            for mountain in self.record_util.getMountainsWithMountainName(name)
+            if IN_PROCESS_PROVIDER in mountain["url"]
+        ]
+        mountains = sorted(
+            mountains,
+            key=lambda x: (self.filter_util.getAltitude(x["altitude"]), x["name"]),
+            reverse=True,
+        )
+
+        for mountain in mountains:
+            altitude = self.filter_util.getAltitude(mountain["altitude"])
+            # same altitude filter as get_recent_record2.py (-g/-u defaults) which the subprocess path runs
+            if not self.filter_util.isAltitudeInRange(altitude):
+                continue
+            key = (
+                mountain["name"].strip(),
+                mountain["yomi"].strip(),
+                altitude,
+            )
+            try:
+                records = self.record_util.parseRecentRecord(mountain["url"])
+            except:
+                continue
+
+            n = 0
+            for record in records:
+                if not record or not record.get("date"):
+                    continue
+                if (today - record["date"]).days < days:
+                    n += 1
+                    if n <= samples:
+                        grouped[key].append(record["url"])
+
+        return grouped
+
+    def parse_detail(self, url):
+        try:
+            data = self.detail_record_util(url).data
+        except:
+            return None
+
+        # "duration" is "--:--" if the standard course time isn't available
+        duration = None
+        for key in ("duration", "actual_duration"):
+            duration = re.match(r"\s*(\d+):(\d+)", str(data.get(key)))
+            if duration:
+                break
+        distance = re.match(r"\s*([\d\.]+)km", str(data.get("distance")))
+        gain = re.match(r"\s*([\d,]+)m", str(data.get("elevation_gained")))
+        access = re.match(r"\s*([\d\.]+)\s+([\d\.]+)", str(data.get("access_lat_lon")))
+        title = data.get("title")
+
+        if not duration or not access:
+            return None
+
+        return {
+            "duration_min":
+                int(duration.group(1)) * 60 + int(duration.group(2)),
+            "distance_km":
+                float(distance.group(1)) if distance else None,
+            "elevation_gain":
+                int(gain.group(1).replace(",", "")) if gain else None,
+            "lat": float(access.group(1)),
+            "lon": float(access.group(2)),
+            "title": title.strip() if title else None
+        }
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline():
+    global _pipeline, USE_IN_PROCESS
+
+    with _pipeline_lock:
+        if _pipeline is None and USE_IN_PROCESS:
+            try:
+                _pipeline = InProcessPipeline()
+            except Exception as e:
+                print(f"WARNING: in-process pipeline isn't available, use subprocess: {e}")
+                USE_IN_PROCESS = False
+
+    return _pipeline
+
+
+def load_py_variable(filename, varname):
+    # .py or .sqlite
+    return load_db(filename, varname)
 
 
 def distance_meter(lat1, lon1, lat2, lon2):
@@ -64,6 +310,60 @@ def distance_meter(lat1, lon1, lat2, lon2):
     return math.sqrt(dx * dx + dy * dy)
 
 
+class GridIndex:
+    # buckets the points into cells of cell_meter then the points within cell_meter are found in the 3x3 neighbor cells
+    def __init__(self, cell_meter=NEAR_DISTANCE_METER):
+        self.cell_meter = cell_meter
+        self.lat_step = cell_meter / 111000
+        self.cells = defaultdict(list)
+        self.count = 0
+
+    def get_row(self, lat):
+        return math.floor(lat / self.lat_step)
+
+    def get_col(self, row, lon):
+        # the cell width in degree is fixed per row
+        cos = max(math.cos(math.radians(row * self.lat_step)), 0.01)
+        return math.floor(lon / (self.lat_step / cos))
+
+    def get_cell(self, lat, lon):
+        row = self.get_row(lat)
+        return (row, self.get_col(row, lon))
+
+    def get_neighbor_cells(self, lat, lon):
+        row = self.get_row(lat)
+
+        for _row in (row - 1, row, row + 1):
+            col = self.get_col(_row, lon)
+            for _col in (col - 1, col, col + 1):
+                yield (_row, _col)
+
+    def add(self, lat, lon, item):
+        self.cells[self.get_cell(lat, lon)].append(
+            (self.count, lat, lon, item)
+        )
+        self.count += 1
+
+    def get_neighbors(self, lat, lon):
+        for cell in self.get_neighbor_cells(lat, lon):
+            yield from self.cells.get(cell, [])
+
+    def nearest(self, lat, lon, max_meter=None):
+        # returns (item, distance). the earlier added one wins the tie as same as the linear scan
+        max_meter = self.cell_meter if max_meter is None else min(max_meter, self.cell_meter)
+        best = None
+
+        for index, _lat, _lon, item in self.get_neighbors(lat, lon):
+            d = distance_meter(lat, lon, _lat, _lon)
+            if d <= max_meter and (best is None or (d, index) < (best[0], best[1])):
+                best = (d, index, item)
+
+        if best is None:
+            return None, None
+
+        return best[2], best[0]
+
+
 def generate_mountain_uuid(name, yomi, altitude, lat, lon):
     s = f"{name}|{yomi}|{altitude}|{lat:.5f}|{lon:.5f}"
     return hashlib.sha1(s.encode()).hexdigest()[:16]
@@ -76,10 +376,11 @@ def generate_trailhead_uuid(lat, lon):
 def dms_to_decimal(deg, minute, sec):
     return deg + minute / 60.0 + sec / 3600.0
 
-def parse_mountain_info(name):
+def parse_mountain_info_by_subprocess(name):
     result = []
     out = ""
     try:
+        acquire_rate_limit("https://www.yamareco.com/")
         out = run(f'python3 {MOUNTAIN_INFO} "{name}" -p yamareco')
     except:
         return result
@@ -133,22 +434,35 @@ def parse_mountain_info(name):
         yomi = yomi_match.group(1).strip()
         url = url_match.group(1).strip()
 
-        result.append({
-            "mountain_uuid": generate_mountain_uuid(
-                name_value, yomi, altitude, lat, lon
-            ),
-            "mountain_name": name_value,
-            "yomi": yomi,
-            "latitude": lat,
-            "longitude": lon,
-            "altitude": altitude,
-            "url": url,
-            "flags": categories
-        })
+        result.append(
+            to_mountain_info(name_value, yomi, altitude, lat, lon, url, categories)
+        )
 
     return result
 
 
+def to_mountain_info(name, yomi, altitude, lat, lon, url, categories):
+    return {
+        "mountain_uuid": generate_mountain_uuid(
+            name, yomi, altitude, lat, lon
+        ),
+        "mountain_name": name,
+        "yomi": yomi,
+        "latitude": lat,
+        "longitude": lon,
+        "altitude": altitude,
+        "url": url,
+        "flags": categories
+    }
+
+
+def parse_mountain_info(name):
+    pipeline = get_pipeline()
+    if pipeline:
+        return pipeline.parse_mountain_info(name)
+    return parse_mountain_info_by_subprocess(name)
+
+
 def merge_mountain(dst, src):
     # URL
     if not dst.get("url") and src.get("url"):
@@ -174,9 +488,17 @@ def merge_mountain(dst, src):
 
 
 def parse_recent_records(name, days, samples):
+    pipeline = get_pipeline()
+    if pipeline:
+        return pipeline.parse_recent_records(name, days, samples)
+    return parse_recent_records_by_subprocess(name, days, samples)
+
+
+def parse_recent_records_by_subprocess(name, days, samples):
     out = ""
     grouped = defaultdict(list)
     try:
+        acquire_rate_limit("https://www.yamareco.com/")
         out = run(f'python3 {RECENT_RECORD} "{name}" -p yamareco -d {days} -n {samples}')
     except:
         pass
@@ -229,8 +551,16 @@ def is_vertical_route(title):
     )
 
 def parse_detail(url):
+    pipeline = get_pipeline()
+    if pipeline:
+        return pipeline.parse_detail(url)
+    return parse_detail_by_subprocess(url)
+
+
+def parse_detail_by_subprocess(url):
     out = ""
     try:
+        acquire_rate_limit(url)
         out = run(f'python3 {DETAIL_RECORD} "{url}"')
     except:
         return None
@@ -262,39 +592,103 @@ def parse_detail(url):
         "title": title.group(1).strip() if title else None
     }
 
-def cluster_trailheads(records):
-    clusters = []
+def get_record_sort_key(rec):
+    return (
+        rec["lat"],
+        rec["lon"],
+        rec["duration_min"],
+        rec["distance_km"] if rec["distance_km"] is not None else -1,
+        rec["elevation_gain"] if rec["elevation_gain"] is not None else -1,
+        rec["title"] or "",
+    )
 
-    for rec in records:
-        merged = False
 
-        for cluster in clusters:
-            center = cluster["center"]
-            d = distance_meter(
-                rec["lat"], rec["lon"],
-                center["lat"], center["lon"]
-            )
+def cluster_trailheads(records, order_independent=None):
+    # a record joins the 1st created cluster whose center is within NEAR_DISTANCE_METER.
+    # the centers are bucketed by the grid and kept as running sums then it's linear in the number of records.
+    # order_independent sorts the records 1st then the clusters don't depend on the fetched order
+    if order_independent is None:
+        order_independent = CLUSTER_ORDER_INDEPENDENT
+    if order_independent:
+        records = sorted(records, key=get_record_sort_key)
 
-            if d <= NEAR_DISTANCE_METER:
-                cluster["records"].append(rec)
+    grid = GridIndex(NEAR_DISTANCE_METER)
+    cells = defaultdict(set)
+    clusters = []
+    sums = []
 
-                cluster["center"]["lat"] = statistics.mean(
-                    [x["lat"] for x in cluster["records"]]
-                )
-                cluster["center"]["lon"] = statistics.mean(
-                    [x["lon"] for x in cluster["records"]]
+    for rec in records:
+        best = None
+
+        for cell in grid.get_neighbor_cells(rec["lat"], rec["lon"]):
+            for i in cells.get(cell, ()):
+                if best is not None and i > best:
+                    continue
+                center = clusters[i]["center"]
+                d = distance_meter(
+                    rec["lat"], rec["lon"],
+                    center["lat"], center["lon"]
                 )
-                merged = True
-                break
+                if d <= NEAR_DISTANCE_METER:
+                    best = i
 
-        if not merged:
+        if best is None:
             clusters.append({
                 "center": {"lat": rec["lat"], "lon": rec["lon"]},
                 "records": [rec]
             })
+            sums.append([rec["lat"], rec["lon"]])
+            cells[grid.get_cell(rec["lat"], rec["lon"])].add(len(clusters) - 1)
+            continue
+
+        cluster = clusters[best]
+        center = cluster["center"]
+        cells[grid.get_cell(center["lat"], center["lon"])].discard(best)
+
+        cluster["records"].append(rec)
+        sums[best][0] += rec["lat"]
+        sums[best][1] += rec["lon"]
+        center["lat"] = sums[best][0] / len(cluster["records"])
+        center["lon"] = sums[best][1] / len(cluster["records"])
+
+        cells[grid.get_cell(center["lat"], center["lon"])].add(best)
 
     return clusters
 
+
+def get_trailhead_ids(clusters, stable=None):
+    # stable ids are from the center snapped to TRAILHEAD_ID_GRID_METER then a few more samples don't change them
+    if stable is None:
+        stable = CLUSTER_ORDER_INDEPENDENT
+
+    result = []
+    used = set()
+
+    for cluster in clusters:
+        lat = cluster["center"]["lat"]
+        lon = cluster["center"]["lon"]
+        trailhead_id = None
+
+        if stable:
+            step = TRAILHEAD_ID_GRID_METER / 111000
+            trailhead_id = generate_trailhead_uuid(
+                round(lat / step) * step,
+                round(lon / step) * step,
+            )
+            if trailhead_id in used:
+                trailhead_id = None
+
+        if trailhead_id is None:
+            trailhead_id = generate_trailhead_uuid(
+                lat,
+                lon,
+            )
+
+        used.add(trailhead_id)
+        result.append(trailhead_id)
+
+    return result
+
 def merge_trailhead(dst, src):
     n1 = dst.get("sample_count", 0)
     n2 = src.get("sample_count", 0)
@@ -418,25 +812,75 @@ def parse_tozanguchi(mountain_name):
     return result
 
 
-def resolve_trailhead_name(mountain_name, lat, lon):
-    candidates = parse_tozanguchi(mountain_name)
+_tozanguchi_indexes = {}
+_tozanguchi_locks = defaultdict(threading.Lock)
+_tozanguchi_lock = threading.Lock()
+_tozanguchi_cache = None
+
+def set_tozanguchi_cache_hours(hours):
+    # persists the trailhead candidates per mountain across the runs. 0: disabled, -1: never expire
+    global _tozanguchi_cache
+
+    _tozanguchi_cache = None
+    if hours:
+        try:
+            from mountainRecordUtil import JsonCache, JsonCacheFactory, CacheCodec
+            _tozanguchi_cache = JsonCacheFactory.create(
+                os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, "tozanguchi"),
+                hours,
+                TOZANGUCHI_CACHE_NUM,
+                format=CacheCodec.FORMAT_COMPACT,
+            )
+        except Exception as e:
+            print(f"WARNING: tozanguchi cache isn't available: {e}")
+
+
+def get_tozanguchi_cache_key(mountain_name):
+    # the cache filename drops non-ascii characters
+    return "tozanguchi/" + hashlib.sha1(mountain_name.encode()).hexdigest()
 
-    best = None
-    best_dist = 999999
 
-    for c in candidates:
-        d = distance_meter(lat, lon, c["lat"], c["lon"])
-        if d < best_dist:
-            best = c
-            best_dist = d
+def get_tozanguchi_index(mountain_name):
+    # get_tozanguchi.py runs once per mountain in a run even if the mountain has many trailhead clusters
+    with _tozanguchi_lock:
+        lock = _tozanguchi_locks[mountain_name]
 
-    if best and best_dist <= NEAR_DISTANCE_METER:
+    with lock:
+        if mountain_name not in _tozanguchi_indexes:
+            candidates = None
+            key = get_tozanguchi_cache_key(mountain_name)
+
+            if _tozanguchi_cache:
+                candidates = _tozanguchi_cache.restoreFromCache(key)
+
+            if not candidates:
+                candidates = parse_tozanguchi(mountain_name)
+                if candidates and _tozanguchi_cache:
+                    _tozanguchi_cache.storeToCache(key, candidates)
+
+            index = GridIndex(NEAR_DISTANCE_METER)
+            for c in candidates:
+                index.add(c["lat"], c["lon"], c)
+
+            _tozanguchi_indexes[mountain_name] = index
+
+        return _tozanguchi_indexes[mountain_name]
+
+
+def resolve_trailhead_name(mountain_name, lat, lon):
+    best, _ = get_tozanguchi_index(mountain_name).nearest(
+        lat,
+        lon,
+        NEAR_DISTANCE_METER,
+    )
+
+    if best:
         return best["name"]
 
     return f"{mountain_name}_登山口駐車場"
 
 
-def get_route_time(lat, lon):
+def get_route_time_by_subprocess(lat, lon):
     try:
         out = run(f'python3 {ROUTE_TIME} {lat} {lon}')
     except:
@@ -449,6 +893,219 @@ def get_route_time(lat, lon):
     return int(m.group(1)) * 60 + int(m.group(2))
 
 
+class SubprocessRouter:
+    # get_route_time.py resolves a trailhead per call
+    supports_batch = False
+
+    def get_id(self):
+        return ROUTE_TIME
+
+    def get_route_time(self, lat, lon):
+        return get_route_time_by_subprocess(lat, lon)
+
+
+class OsrmRouter:
+    # OSRM compatible router. the drive times from the origin to many trailheads are resolved by a table (matrix) query
+    supports_batch = True
+    MAX_BATCH = 100
+    TIMEOUT_SEC = 30
+
+    def __init__(self, base_url, origin_lat, origin_lon, profile="driving"):
+        self.base_url = base_url.rstrip("/")
+        self.origin_lat = origin_lat
+        self.origin_lon = origin_lon
+        self.profile = profile
+
+    def get_id(self):
+        return f"{self.base_url}|{self.profile}|{self.origin_lat:.5f}|{self.origin_lon:.5f}"
+
+    def get_route_time(self, lat, lon):
+        return self.get_route_times([(lat, lon)])[0]
+
+    def get_route_times(self, points):
+        result = []
+
+        for i in range(0, len(points), self.MAX_BATCH):
+            chunk = points[i:i + self.MAX_BATCH]
+            coordinates = ";".join(
+                f"{lon},{lat}"
+                for lat, lon in [(self.origin_lat, self.origin_lon)] + chunk
+            )
+            durations = [None] * len(chunk)
+
+            try:
+                url = f"{self.base_url}/table/v1/{self.profile}/{coordinates}?sources=0"
+                with urllib.request.urlopen(url, timeout=self.TIMEOUT_SEC) as res:
+                    data = json.load(res)
+                if data.get("code") == "Ok" and len(data["durations"][0]) == len(chunk) + 1:
+                    durations = data["durations"][0][1:]
+            except:
+                pass
+
+            result.extend(
+                int(round(sec / 60)) if sec is not None else None
+                for sec in durations
+            )
+
+        return result
+
+
+class RouteTimeCache:
+    # drive times of the known trailheads. the trailheads within tolerance_meter reuse them
+    def __init__(self, path, tolerance_meter=DEFAULT_ROUTE_TIME_TOLERANCE_METER, expire_days=ROUTE_TIME_CACHE_EXPIRE_DAYS, max_entries=ROUTE_TIME_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.tolerance_meter = tolerance_meter
+        self.expire_days = expire_days
+        self.max_entries = max_entries
+        self.entries = []
+        self.index = GridIndex(tolerance_meter)
+        self.lock = threading.Lock()
+        self.is_dirty = False
+        self.load()
+
+    def load(self):
+        entries = []
+
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except:
+            pass
+
+        for entry in self.get_alive_entries(entries):
+            self.entries.append(entry)
+            self.index.add(entry["lat"], entry["lon"], entry)
+
+    def get_alive_entries(self, entries):
+        # not expired and up to max_entries of the newest
+        expire = time.time() - self.expire_days * 24 * 60 * 60
+        result = [entry for entry in entries if entry.get("updated", 0) >= expire]
+
+        if self.max_entries and len(result) > self.max_entries:
+            result = sorted(result, key=lambda entry: entry["updated"])[-self.max_entries:]
+
+        return result
+
+    def get(self, lat, lon):
+        with self.lock:
+            entry, _ = self.index.nearest(lat, lon, self.tolerance_meter)
+            return entry["route_time_min"] if entry else None
+
+    def put(self, lat, lon, route_time):
+        entry = {
+            "lat": lat,
+            "lon": lon,
+            "route_time_min": route_time,
+            "updated": time.time(),
+        }
+
+        with self.lock:
+            self.entries.append(entry)
+            self.index.add(lat, lon, entry)
+            self.is_dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.is_dirty:
+                return
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            # the entries expired during the run and the oldest ones over max_entries aren't saved
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.get_alive_entries(self.entries), f)
+            os.replace(tmp_path, self.path)
+            self.is_dirty = False
+
+
+class RouteTimeResolver:
+    def __init__(self, router, cache=None):
+        self.router = router
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.stats = {"cache_hit": 0, "routed": 0, "router_calls": 0}
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def resolve(self, points):
+        result = [None] * len(points)
+        misses = []
+
+        for i, (lat, lon) in enumerate(points):
+            route_time = self.cache.get(lat, lon) if self.cache else None
+            if route_time is not None:
+                result[i] = route_time
+                self.count("cache_hit")
+            else:
+                misses.append(i)
+
+        if not misses:
+            return result
+
+        if self.router.supports_batch:
+            route_times = self.router.get_route_times(
+                [points[i] for i in misses]
+            )
+            self.count("router_calls", math.ceil(len(misses) / self.router.MAX_BATCH))
+            self.count("routed", len(misses))
+
+            for i, route_time in zip(misses, route_times):
+                result[i] = route_time
+                if route_time is not None and self.cache:
+                    self.cache.put(*points[i], route_time)
+        else:
+            for i in misses:
+                lat, lon = points[i]
+                # the earlier trailhead of this batch may be close enough
+                route_time = self.cache.get(lat, lon) if self.cache else None
+                if route_time is not None:
+                    self.count("cache_hit")
+                else:
+                    route_time = self.router.get_route_time(lat, lon)
+                    self.count("router_calls")
+                    self.count("routed")
+                    if route_time is not None and self.cache:
+                        self.cache.put(lat, lon, route_time)
+                result[i] = route_time
+
+        return result
+
+
+_route_time_resolver = RouteTimeResolver(SubprocessRouter())
+
+def set_route_time_resolver(router=None, tolerance_meter=DEFAULT_ROUTE_TIME_TOLERANCE_METER):
+    # tolerance_meter=0 disables the persistent cache
+    global _route_time_resolver
+
+    router = router or SubprocessRouter()
+    cache = None
+    if tolerance_meter and tolerance_meter > 0:
+        cache = RouteTimeCache(
+            os.path.join(
+                ROUTE_TIME_CACHE_DIR,
+                f"route_time_{hashlib.sha1(router.get_id().encode()).hexdigest()[:16]}.json",
+            ),
+            tolerance_meter,
+        )
+
+    _route_time_resolver = RouteTimeResolver(router, cache)
+    return _route_time_resolver
+
+
+def get_route_time_resolver():
+    return _route_time_resolver
+
+
+def resolve_route_times(points):
+    return _route_time_resolver.resolve(points)
+
+
+def get_route_time(lat, lon):
+    return resolve_route_times([(lat, lon)])[0]
+
+
 def merge_user_route(user_routes, trailhead_id, route_time, trailhead_name):
     if route_time is None:
         return
@@ -482,14 +1139,8 @@ def merge_db(existing_db, new_db):
     return result
 
 def save_python_db(filename, varname, data):
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(f"{varname} = ")
-        pprint.pprint(
-            data,
-            stream=f,
-            sort_dicts=False,
-            width=120,
-        )
+    # .py or .sqlite by the extension
+    save_db(filename, varname, data)
 
 def normalize(text):
     if text is None:
@@ -565,154 +1216,295 @@ def find_matching_info(key, infos):
 
 
 
-def build_db(mountain_names, days, samples, user_out, existing_db=None, existing_user_routes=None):
-    db = copy.deepcopy(existing_db or {})
-    user_routes = copy.deepcopy(existing_user_routes or {})
-    not_found = []
-    no_recent_records = []
-    info_mismatch = []
+class MountainJournal:
+    # append-only jsonl of the processed mountains. the interrupted run is resumed by replaying it
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self):
+        results = []
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        results.append(json.loads(line))
+                    except ValueError:
+                        # the last line may be cut by the crash
+                        pass
+
+            # rewrite with the valid entries then the following append doesn't continue the cut line
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for result in results:
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+
+        return results
+
+    def append(self, result):
+        line = json.dumps(result, ensure_ascii=False)
+
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def process_mountain(name, days, samples, user_out, detail_executor):
+    # fetches a mountain. the results are merged into the db by build_db()
+    result = {
+        "name": name,
+        "status": None,
+        "infos": [],
+        "user_routes": [],
+    }
+    route_points = []
 
-    is_wait_required = False
+    print("processing:", name)
 
-    for name in mountain_names:
+    infos = parse_mountain_info(name)
+    if not infos:
+        print(f"WARNING: mountain info not found: {name}")
+        result["status"] = "not_found"
+        return result
 
-        print("processing:", name)
+    record_groups = parse_recent_records(name, days, samples)
+    if not record_groups:
+        print(f"WARNING: no recent records: {name}")
+        result["status"] = "no_recent_records"
+        return result
 
-        if is_wait_required:
-            time.sleep(WAIT_SECONDS_PER_MOUNTAIN)
-        is_wait_required = True
+    for key, urls in record_groups.items():
+        info = find_matching_info(
+            key,
+            infos,
+        )
 
-        infos = parse_mountain_info(name)
-        if not infos:
-            print(f"WARNING: mountain info not found: {name}")
-            not_found.append(name)
+        if info is None:
+            print(
+                f"WARNING: cannot match mountain info: "
+                f"{key}"
+            )
             continue
 
-        record_groups = parse_recent_records(name, days, samples)
-        if not record_groups:
-            print(f"WARNING: no recent records: {name}")
-            no_recent_records.append(name)
+        records = [
+            detail
+            for detail in detail_executor.map(parse_detail, urls)
+            if detail
+        ]
+
+        if not records:
             continue
 
-        for key, urls in record_groups.items():
-            info = find_matching_info(
-                key,
-                infos,
-            )
+        clusters = cluster_trailheads(records)
 
-            if info is None:
-                print(
-                    f"WARNING: cannot match mountain info: "
-                    f"{key}"
-                )
-                continue
-
-            records = []
+        trailheads = {}
 
-            for url in urls:
-                detail = parse_detail(url)
-                if detail:
-                    records.append(detail)
+        for cluster, trailhead_id in zip(clusters, get_trailhead_ids(clusters)):
 
-            if not records:
-                continue
+            rows = cluster["records"]
 
-            clusters = cluster_trailheads(records)
+            lat = cluster["center"]["lat"]
+            lon = cluster["center"]["lon"]
 
-            trailheads = {}
+            trailhead_name = resolve_trailhead_name(
+                info["mountain_name"],
+                lat,
+                lon,
+            )
 
-            for cluster in clusters:
+            durations = [
+                x["duration_min"]
+                for x in rows
+            ]
 
-                rows = cluster["records"]
+            distances = [
+                x["distance_km"]
+                for x in rows
+                if x["distance_km"] is not None
+            ]
 
-                lat = cluster["center"]["lat"]
-                lon = cluster["center"]["lon"]
+            gains = [
+                x["elevation_gain"]
+                for x in rows
+                if x["elevation_gain"] is not None
+            ]
 
-                trailhead_id = generate_trailhead_uuid(
+            trailheads[trailhead_id] = {
+                "trailhead_id": trailhead_id,
+                "trailhead_name": trailhead_name,
+                "latitude": lat,
+                "longitude": lon,
+
+                "climb_time_min": min(durations),
+                "climb_time_median": int(statistics.median(durations)),
+                "climb_time_max": max(durations),
+
+                "distance_min_km":
+                    min(distances) if distances else None,
+                "distance_median_km":
+                    statistics.median(distances)
+                    if distances else None,
+                "distance_max_km":
+                    max(distances) if distances else None,
+
+                "elevation_gain_min":
+                    min(gains) if gains else None,
+                "elevation_gain_median":
+                    int(statistics.median(gains))
+                    if gains else None,
+                "elevation_gain_max":
+                    max(gains) if gains else None,
+
+                "sample_count": len(rows),
+            }
+
+            # user_route_db
+            if user_out:
+                route_points.append((
+                    trailhead_id,
                     lat,
                     lon,
-                )
+                    trailhead_name,
+                ))
 
-                trailhead_name = resolve_trailhead_name(
-                    info["mountain_name"],
-                    lat,
-                    lon,
-                )
+        info["trailheads"] = trailheads
+        result["infos"].append(info)
 
-                durations = [
-                    x["duration_min"]
-                    for x in rows
-                ]
-
-                distances = [
-                    x["distance_km"]
-                    for x in rows
-                    if x["distance_km"] is not None
-                ]
-
-                gains = [
-                    x["elevation_gain"]
-                    for x in rows
-                    if x["elevation_gain"] is not None
-                ]
-
-                trailheads[trailhead_id] = {
-                    "trailhead_id": trailhead_id,
-                    "trailhead_name": trailhead_name,
-                    "latitude": lat,
-                    "longitude": lon,
-
-                    "climb_time_min": min(durations),
-                    "climb_time_median": int(statistics.median(durations)),
-                    "climb_time_max": max(durations),
-
-                    "distance_min_km":
-                        min(distances) if distances else None,
-                    "distance_median_km":
-                        statistics.median(distances)
-                        if distances else None,
-                    "distance_max_km":
-                        max(distances) if distances else None,
-
-                    "elevation_gain_min":
-                        min(gains) if gains else None,
-                    "elevation_gain_median":
-                        int(statistics.median(gains))
-                        if gains else None,
-                    "elevation_gain_max":
-                        max(gains) if gains else None,
-
-                    "sample_count": len(rows),
-                }
-
-                # user_route_db
-                if user_out:
-                    route_time = get_route_time(lat, lon)
-
-                    merge_user_route(
-                        user_routes,
-                        trailhead_id,
-                        route_time,
-                        trailhead_name,
-                    )
-
-            info["trailheads"] = trailheads
-
-            uuid = info["mountain_uuid"]
-
-            # merge into db
-            if uuid not in db:
-                db[uuid] = info
-            else:
-                merge_mountain(
-                    db[uuid],
-                    info,
+    # the drive times of all the trailheads of the mountain are resolved at once
+    route_times = resolve_route_times(
+        [(lat, lon) for _, lat, lon, _ in route_points]
+    )
+    for (trailhead_id, _, _, trailhead_name), route_time in zip(route_points, route_times):
+        result["user_routes"].append((
+            trailhead_id,
+            route_time,
+            trailhead_name,
+        ))
+
+    return result
+
+
+def process_mountain_with_journal(name, days, samples, user_out, detail_executor, journal):
+    result = process_mountain(name, days, samples, user_out, detail_executor)
+
+    if journal:
+        journal.append(result)
+
+    return result
+
+
+def merge_result(db, user_routes, result, not_found, no_recent_records):
+    if result["status"] == "not_found":
+        not_found.append(result["name"])
+        return
+
+    if result["status"] == "no_recent_records":
+        no_recent_records.append(result["name"])
+        return
+
+    for trailhead_id, route_time, trailhead_name in result["user_routes"]:
+        merge_user_route(
+            user_routes,
+            trailhead_id,
+            route_time,
+            trailhead_name,
+        )
+
+    for info in result["infos"]:
+        uuid = info["mountain_uuid"]
+
+        # merge into db
+        if uuid not in db:
+            db[uuid] = info
+        else:
+            merge_mountain(
+                db[uuid],
+                info,
+            )
+
+
+def build_db(mountain_names, days, samples, user_out, existing_db=None, existing_user_routes=None, jobs=DEFAULT_MOUNTAIN_JOBS, detail_jobs=DEFAULT_DETAIL_JOBS, requests_per_sec=None, journal=None, replayed_results=None):
+    global _rate_limiter
+
+    db = copy.deepcopy(existing_db or {})
+    user_routes = copy.deepcopy(existing_user_routes or {})
+    not_found = []
+    no_recent_records = []
+    info_mismatch = []
+
+    # the mountains done by the interrupted run
+    for result in replayed_results or []:
+        merge_result(
+            db,
+            user_routes,
+            result,
+            not_found,
+            no_recent_records,
+        )
+
+    _rate_limiter = HostRateLimiter(
+        requests_per_sec or DEFAULT_REQUESTS_PER_SEC
+    )
+    pipeline = get_pipeline()
+    if pipeline:
+        pipeline.set_rate_limiter(_rate_limiter)
+
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, detail_jobs)) as detail_executor, \
+         ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+
+        futures = [
+            executor.submit(
+                process_mountain_with_journal,
+                name,
+                days,
+                samples,
+                user_out,
+                detail_executor,
+                journal,
+            )
+            for name in mountain_names
+        ]
+
+        try:
+            # merged in the input order then the db is same as the sequential run
+            for future in futures:
+                merge_result(
+                    db,
+                    user_routes,
+                    future.result(),
+                    not_found,
+                    no_recent_records,
                 )
+        except KeyboardInterrupt:
+            # the running mountains are still journaled but the queued ones are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+            detail_executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    elapsed = time.monotonic() - start
 
     return db, user_routes, {
         "not_found": not_found,
         "no_recent_records": no_recent_records,
         "info_mismatch": info_mismatch,
+        "throughput": {
+            "elapsed_sec": elapsed,
+            "mountains": len(mountain_names),
+            "requests": _rate_limiter.get_counts(),
+        },
     }
 
 
@@ -739,9 +1531,38 @@ def main():
     parser.add_argument("--user-out", default="user_route_db.py")
     parser.add_argument("--days", type=int, default=30)
     parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--subprocess", action="store_true", help="run get_mountain_info.py, get_recent_record2.py and get_detail_record.py as subprocess")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_MOUNTAIN_JOBS, help="mountains fetched concurrently")
+    parser.add_argument("--detail-jobs", type=int, default=DEFAULT_DETAIL_JOBS, help="detail records fetched concurrently")
+    parser.add_argument("--yamareco-rps", type=float, default=DEFAULT_REQUESTS_PER_SEC["yamareco.com"], help="max requests per second to yamareco.com (0: unlimited)")
+    parser.add_argument("--yamap-rps", type=float, default=DEFAULT_REQUESTS_PER_SEC["yamap.com"], help="max requests per second to yamap.com (0: unlimited)")
+    parser.add_argument("--journal", default=None, help="journal of the processed mountains (default: <db-out>.journal)")
+    parser.add_argument("--resume", action="store_true", help="skip the mountains in the journal of the interrupted run and merge them")
+    parser.add_argument("--discard-journal", action="store_true", help="discard the journal of the interrupted run and fetch from scratch")
+    parser.add_argument("--route-time-tolerance", type=float, default=DEFAULT_ROUTE_TIME_TOLERANCE_METER, help="reuse the cached drive time of a trailhead within this meters (0: no cache)")
+    parser.add_argument("--route-time-router", default=None, help="OSRM compatible router url e.g. http://localhost:5000 instead of get_route_time.py. the drive times are resolved by the table query")
+    parser.add_argument("--route-origin", default=None, help="origin 'lat,lon' of the drive time for --route-time-router")
+    parser.add_argument("--stable-trailheads", action="store_true", help="cluster the records regardless of the fetched order and keep the trailhead ids on a 50m grid")
+    parser.add_argument("--tozanguchi-cache-hours", type=int, default=0, help="keep the trailhead candidates of get_tozanguchi.py across the runs (0: disabled, -1: never expire)")
 
     args = parser.parse_args()
 
+    global USE_IN_PROCESS, CLUSTER_ORDER_INDEPENDENT
+    if args.subprocess:
+        USE_IN_PROCESS = False
+    if args.stable_trailheads:
+        CLUSTER_ORDER_INDEPENDENT = True
+
+    set_tozanguchi_cache_hours(args.tozanguchi_cache_hours)
+
+    router = None
+    if args.route_time_router:
+        if not args.route_origin:
+            parser.error("--route-origin is required with --route-time-router")
+        origin_lat, origin_lon = [float(x) for x in args.route_origin.split(",")]
+        router = OsrmRouter(args.route_time_router, origin_lat, origin_lon)
+    route_time_resolver = set_route_time_resolver(router, args.route_time_tolerance)
+
     # load existing DB
     existing_db = load_py_variable(
         args.db_out,
@@ -762,32 +1583,75 @@ def main():
         for mountain in existing_db.values()
     }
 
+    # journal of the processed mountains
+    journal = MountainJournal(
+        args.journal or f"{args.db_out or 'mountain_db.py'}.journal"
+    )
+    replayed_results = []
+
+    if args.resume and args.discard_journal:
+        parser.error("--resume and --discard-journal are exclusive")
+
+    if args.resume:
+        replayed_results = journal.load()
+    elif os.path.exists(journal.path):
+        # the progress of the interrupted run is never dropped implicitly
+        if not args.discard_journal:
+            parser.error(
+                f"{journal.path} of the interrupted run exists. "
+                f"Specify --resume to continue it or --discard-journal to start over."
+            )
+        print(f"{journal.path} is discarded.")
+        journal.clear()
+
+    replayed_names = {
+        result["name"]
+        for result in replayed_results
+    }
+
     target_names = [
         name
         for name in all_names
-        if name not in existing_names
+        if name not in existing_names and name not in replayed_names
     ]
 
     print(
         f"{len(existing_names)} mountains already exist."
     )
+    if replayed_results:
+        print(
+            f"{len(replayed_names)} mountains are resumed from {journal.path}."
+        )
     print(
         f"{len(target_names)} mountains will be fetched."
     )
 
-    if not target_names:
+    if not target_names and not replayed_results:
         print("Nothing to do.")
         return
 
     # fetch & merge
-    db, user_routes, report = build_db(
-        target_names,
-        args.days,
-        args.samples,
-        args.user_out,
-        existing_db,
-        existing_user_routes,
-    )
+    try:
+        db, user_routes, report = build_db(
+            target_names,
+            args.days,
+            args.samples,
+            args.user_out,
+            existing_db,
+            existing_user_routes,
+            args.jobs,
+            args.detail_jobs,
+            {
+                "yamareco.com": args.yamareco_rps,
+                "yamap.com": args.yamap_rps,
+            },
+            journal,
+            replayed_results,
+        )
+    finally:
+        # the drive times are kept even if the run is interrupted
+        if route_time_resolver.cache:
+            route_time_resolver.cache.save()
 
     # save
     if args.db_out:
@@ -804,11 +1668,29 @@ def main():
             user_routes,
         )
 
+    # the journaled mountains are in the db now
+    journal.clear()
+
     print()
     print(
         f"Done. mountain_db={len(db)}, "
         f"user_route_db={len(user_routes)}"
     )
+
+    throughput = report["throughput"]
+    elapsed = max(throughput["elapsed_sec"], 0.001)
+    print(
+        f"Throughput: {throughput['mountains']} mountains in {elapsed:.1f} sec "
+        f"({throughput['mountains'] * 60 / elapsed:.2f} mountains/min)"
+    )
+    for domain, count in sorted(throughput["requests"].items()):
+        print(f"  {domain}: {count} requests ({count / elapsed:.2f} req/s)")
+
+    route_stats = route_time_resolver.stats
+    print(
+        f"Route time: {route_stats['routed']} routed by {route_stats['router_calls']} router calls, "
+        f"{route_stats['cache_hit']} cache hits"
+    )
     if report["not_found"]:
         print()
         print("Mountain info not found:")
@@ -13,8 +13,7 @@
 #   limitations under the License.
 
 import argparse
-import requests
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -29,8 +28,13 @@ from datetime import timedelta, datetime
 import glob
 import shlex
 import time
+import threading
+import queue
+import atexit
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
 from urllib.parse import urlparse
-from mountainRecordUtil import JsonCache, NumUtil, StrUtil, ExecUtil
+from mountainRecordUtil import JsonCache, JsonCacheFactory, CacheCodec, HttpUtil, HtmlUtil, NumUtil, StrUtil, ExecUtil
 
 try:
 	from get_mapcode import get_mapcode
@@ -40,6 +44,8 @@ except:
 
 class ParserBase:
 	TARGET_URL = "DUMMY"
+	PARSE_ONLY = None # SoupStrainer of the subtrees which parseRecentRecord reads
+
 	def __init__(self):
 		pass
 
@@ -69,6 +75,7 @@ class ParserBase:
 
 class YamarecoParser(ParserBase):
 	TARGET_URL = "https://www.yamareco.com/"
+	PARSE_ONLY = SoupStrainer(class_=re.compile(r'^(record-detail|photo-list-wrap-item-caption|pace-num|impression-txt)'))
 
 	def __init__(self):
 		super().__init__()
@@ -420,35 +427,161 @@ class YamapParser(ParserBase):
 
 
 class WebUtil:
-	_driver = None
+	# pool of headless browsers kept alive across the records.
+	# each browser uses its own reusable user-data-dir then the login session survives across the invocations.
+	NUM_OF_DRIVERS = 1
+	MAX_PROFILES = 8
+	WEB_DRIVER_CACHE_DIR = os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, "webDriver")
+	USER_AGENT_CACHE_HOURS = 24 * 7
+	USER_AGENT_KEY = "chrome://userAgent"
+	LOGIN_STATE_FILENAME = "loginState.json"
+	LOGIN_VALID_HOURS = 12
+
+	_drivers = []
+	_idleDrivers = None
+	_profiles = {}
+	_lock = threading.Lock()
 
 	@staticmethod
-	def get_web_driver(width=1920, height=1080):
-		if WebUtil._driver:
-			return WebUtil._driver
-
-		options = webdriver.ChromeOptions()
-		options.add_argument('--headless')
-		tempDriver = webdriver.Chrome(options=options)
-		userAgent = tempDriver.execute_script("return navigator.userAgent")
-		userAgent = userAgent.replace("headless", "")
-		userAgent = userAgent.replace("Headless", "")
+	def get_user_agent():
+		# probing the user agent launches another browser then it's cached
+		cache = JsonCache(WebUtil.WEB_DRIVER_CACHE_DIR, WebUtil.USER_AGENT_CACHE_HOURS)
+		userAgent = cache.restoreFromCache(WebUtil.USER_AGENT_KEY)
+		if not userAgent:
+			options = webdriver.ChromeOptions()
+			options.add_argument('--headless')
+			tempDriver = webdriver.Chrome(options=options)
+			userAgent = tempDriver.execute_script("return navigator.userAgent")
+			tempDriver.quit()
+			userAgent = userAgent.replace("headless", "")
+			userAgent = userAgent.replace("Headless", "")
+			cache.storeToCache(WebUtil.USER_AGENT_KEY, userAgent)
+		return userAgent
 
+	@staticmethod
+	def get_web_driver(width=1920, height=1080, profileDir=None):
 		options = webdriver.ChromeOptions()
 		options.page_load_strategy = 'eager'
 		options.add_argument('--headless')
-		options.add_argument(f"user-agent={userAgent}")
+		options.add_argument(f"user-agent={WebUtil.get_user_agent()}")
+		if profileDir:
+			options.add_argument(f"--user-data-dir={profileDir}")
 		driver = webdriver.Chrome(options=options)
 		driver.set_window_size(width, height)
 
-		WebUtil._driver = driver
-
 		return driver
 
+	@staticmethod
+	def _create_pooled_driver():
+		# the profile may be locked by another running invocation then the next one (or a temporary one) is used
+		for i in range(WebUtil.MAX_PROFILES):
+			profileDir = os.path.join(WebUtil.WEB_DRIVER_CACHE_DIR, f"profile{i}")
+			if profileDir in WebUtil._profiles.values():
+				continue
+			try:
+				os.makedirs(profileDir, exist_ok=True)
+				driver = WebUtil.get_web_driver(profileDir=profileDir)
+				WebUtil._profiles[id(driver)] = profileDir
+				return driver
+			except:
+				pass
+		return WebUtil.get_web_driver()
+
+	@staticmethod
+	@contextmanager
+	def acquire():
+		with WebUtil._lock:
+			if WebUtil._idleDrivers is None:
+				WebUtil._idleDrivers = queue.Queue()
+				atexit.register(WebUtil.quit_all)
+			driver = None
+			if WebUtil._idleDrivers.empty() and len(WebUtil._drivers) < WebUtil.NUM_OF_DRIVERS:
+				driver = WebUtil._create_pooled_driver()
+				WebUtil._drivers.append(driver)
+		if not driver:
+			driver = WebUtil._idleDrivers.get()
+		try:
+			yield driver
+		finally:
+			WebUtil._idleDrivers.put(driver)
+
+	@staticmethod
+	def quit_all():
+		with WebUtil._lock:
+			for driver in WebUtil._drivers:
+				try:
+					driver.quit()
+				except:
+					pass
+			WebUtil._drivers = []
+			WebUtil._idleDrivers = None
+			WebUtil._profiles = {}
+
+	@staticmethod
+	def _get_login_state_path(driver):
+		profileDir = WebUtil._profiles.get(id(driver))
+		return os.path.join(profileDir, WebUtil.LOGIN_STATE_FILENAME) if profileDir else None
+
+	@staticmethod
+	def _load_login_state(driver):
+		result = {}
+		path = WebUtil._get_login_state_path(driver)
+		if path and os.path.exists(path):
+			try:
+				with open(path, 'r', encoding='UTF-8') as f:
+					result = json.load(f)
+					f.close()
+			except:
+				pass
+		return result
+
+	@staticmethod
+	def _has_cookie(driver, domain):
+		result = True
+		try:
+			cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+			now = time.time()
+			result = any( cookie.get("domain", "").endswith(domain) and ( cookie.get("expires", -1) <= 0 or cookie["expires"] > now ) for cookie in cookies )
+		except:
+			pass
+		return result
+
+	@staticmethod
+	def is_logged_in(driver, parser):
+		expire = WebUtil._load_login_state(driver).get(parser.__class__.__name__, 0)
+		return expire > time.time() and WebUtil._has_cookie(driver, urlparse(parser.TARGET_URL).netloc.replace("www.", ""))
+
+	@staticmethod
+	def set_logged_in(driver, parser, isLoggedIn = True):
+		path = WebUtil._get_login_state_path(driver)
+		if path:
+			state = WebUtil._load_login_state(driver)
+			state[parser.__class__.__name__] = time.time() + WebUtil.LOGIN_VALID_HOURS * 3600 if isLoggedIn else 0
+			try:
+				with open(path, 'w', encoding='UTF-8') as f:
+					json.dump(state, f)
+					f.close()
+			except:
+				pass
+
 
 class MountainDetailRecordUtil:
 	NUM_OF_CACHE = 1000
+	NUM_OF_MEMORY_CACHE = 200
+	CACHE_FORMAT = CacheCodec.FORMAT_ZSTD
 	CACHE_ID = "mountainDetailRecord"
+	_cache = None
+	_cacheLock = threading.Lock()
+
+	@staticmethod
+	def getCache():
+		# shared by all the instances then the cache index is loaded once per run.
+		# DetailRecordFetcher calls this from the worker threads then the creation is guarded
+		if not MountainDetailRecordUtil._cache:
+			with MountainDetailRecordUtil._cacheLock:
+				if not MountainDetailRecordUtil._cache:
+					MountainDetailRecordUtil._cache = JsonCacheFactory.create(os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, MountainDetailRecordUtil.CACHE_ID), JsonCache.CACHE_INFINITE, MountainDetailRecordUtil.NUM_OF_CACHE, memoryCacheEntries=MountainDetailRecordUtil.NUM_OF_MEMORY_CACHE, format=MountainDetailRecordUtil.CACHE_FORMAT)
+		return MountainDetailRecordUtil._cache
 
 	def getParser(self, url):
 		parser = []
@@ -460,13 +593,13 @@ class MountainDetailRecordUtil:
 		return None
 
 
-	def __init__(self, url):
-		cache = JsonCache(os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, self.CACHE_ID), JsonCache.CACHE_INFINITE, self.NUM_OF_CACHE)
+	def __init__(self, url, data = None):
+		cache = MountainDetailRecordUtil.getCache()
 
 		parser = self._parser = self.getParser(url)
 		self._driver = None
 
-		self.data = data = cache.restoreFromCache(url)
+		self.data = data = data if data else cache.restoreFromCache(url)
 		if not data:
 			self.data = data = self.parseRecentRecord(url)
 			if parser and "date" in data and data["date"]:
@@ -496,7 +629,8 @@ class MountainDetailRecordUtil:
 
 		return result
 
-	def _createBaseResult(self, recordUrl = None):
+	@staticmethod
+	def createBaseResult(recordUrl = None):
 		return {
 			'url': recordUrl,
 			'date': None,
@@ -523,29 +657,55 @@ class MountainDetailRecordUtil:
 		return False
 
 	def parseRecentRecord(self, recordUrl):
-		result = self._createBaseResult(recordUrl)
+		result = MountainDetailRecordUtil.createBaseResult(recordUrl)
 		soup = None
 		try:
-			res = requests.get(recordUrl)
-			if res:
-				soup = BeautifulSoup(res.text, 'html.parser')
+			# the session has the cookies of the last browser login if they're not expired yet
+			res = HttpUtil.get(recordUrl)
+			if res and self._parser:
+				soup = HtmlUtil.parse(res.text, self._parser.PARSE_ONLY)
 		except:
 			pass
 
 		if soup and self._parser:
 			result = self._parser.parseRecentRecord(soup, result)
 
-		if self.isFailedToParse(result):
+		if self.isFailedToParse(result) and self._parser:
 			# fallback
-			driver = WebUtil.get_web_driver()
-			if self._parser:
-					if self._parser.login(driver):
-						driver.get(recordUrl)
-						time.sleep(1)
-						driver.get(recordUrl)
-						if self._parser.article_wait(driver):
-							soup = BeautifulSoup(driver.page_source, 'html.parser')
-							result = self._parser.parseRecentRecord(soup, result)
+			with WebUtil.acquire() as driver:
+				result = self._parseRecentRecordWithDriver(driver, recordUrl, result)
+
+		return result
+
+	def _loadArticle(self, driver, recordUrl):
+		driver.get(recordUrl)
+		if self._parser.article_wait(driver):
+			return True
+		# the 1st load after the login may be redirected
+		driver.get(recordUrl)
+		return self._parser.article_wait(driver)
+
+	def _parseRecentRecordWithDriver(self, driver, recordUrl, result):
+		# the login is skipped while the session of the reused browser profile is still valid
+		isLoggedIn = WebUtil.is_logged_in(driver, self._parser)
+		if not isLoggedIn:
+			isLoggedIn = self._parser.login(driver)
+			if isLoggedIn:
+				WebUtil.set_logged_in(driver, self._parser)
+		if isLoggedIn:
+			isLoaded = self._loadArticle(driver, recordUrl)
+			if not isLoaded and self._parser.login(driver):
+				# the session was stale
+				WebUtil.set_logged_in(driver, self._parser)
+				isLoaded = self._loadArticle(driver, recordUrl)
+			if isLoaded:
+				# the authenticated cookies are handed to the plain requests then the later records don't need the browser
+				try:
+					HttpUtil.setCookies(recordUrl, driver.get_cookies())
+				except:
+					pass
+				soup = HtmlUtil.parse(driver.page_source, self._parser.PARSE_ONLY)
+				result = self._parser.parseRecentRecord(soup, result)
 
 		return result
 
@@ -554,6 +714,47 @@ class MountainDetailRecordUtil:
 		return result
 
 
+class DetailRecordFetcher:
+	# fetches the cache missed records concurrently. the results are yielded in the input order
+	DEFAULT_JOBS_PER_HOST = 2
+
+	def __init__(self, jobs = 1, jobsPerHost = DEFAULT_JOBS_PER_HOST):
+		self.jobs = max(1, jobs)
+		self.jobsPerHost = max(1, jobsPerHost)
+		self._hostSemaphores = {}
+		self._lock = threading.Lock()
+
+	def _getHostSemaphore(self, url):
+		host = urlparse(url).netloc
+		with self._lock:
+			if not host in self._hostSemaphores:
+				self._hostSemaphores[host] = threading.BoundedSemaphore(self.jobsPerHost)
+			return self._hostSemaphores[host]
+
+	def _fetch(self, url):
+		with self._getHostSemaphore(url):
+			return MountainDetailRecordUtil(url)
+
+	def fetch(self, urls):
+		if self.jobs <= 1:
+			for aUrl in urls:
+				yield aUrl, MountainDetailRecordUtil(aUrl)
+			return
+
+		cache = MountainDetailRecordUtil.getCache()
+		with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+			results = []
+			for aUrl in urls:
+				data = cache.restoreFromCache(aUrl)
+				if data:
+					# cache hit is served without the pool
+					results.append( (aUrl, MountainDetailRecordUtil(aUrl, data)) )
+				else:
+					results.append( (aUrl, executor.submit(self._fetch, aUrl)) )
+			for aUrl, aResult in results:
+				yield aUrl, aResult.result() if isinstance(aResult, Future) else aResult
+
+
 def flatten_to_text(v):
     if isinstance(v, dict):
         return " ".join(f"{k}: {flatten_to_text(val)}" for k, val in v.items())
@@ -585,11 +786,15 @@ if __name__=="__main__":
 	parser.add_argument('-c', '--clearCache', action='store_true', default=False, help='specify if you want to execute with clearing cache')
 	parser.add_argument('-w', '--oneline', action='store_true', default=False, help='specify if you want to print as oneline manner')
 	parser.add_argument('-x', '--xoneline', action='store_true', default=False, help='specify if you want to print as oneline manner(extended)')
+	parser.add_argument('-j', '--jobs', action='store', default=1, type=int, help='specify the number of concurrent fetches of not cached records')
+	parser.add_argument('--jobsPerHost', action='store', default=DetailRecordFetcher.DEFAULT_JOBS_PER_HOST, type=int, help='specify the max concurrent fetches per host')
+	parser.add_argument('--webDrivers', action='store', default=WebUtil.NUM_OF_DRIVERS, type=int, help='specify the max number of browsers kept for the login required records')
 
 	args = parser.parse_args()
+	WebUtil.NUM_OF_DRIVERS = max(1, args.webDrivers)
 
 	if args.clearCache:
-		JsonCache.clearAllCache(MountainDetailRecordUtil.CACHE_ID)
+		JsonCacheFactory.clearAllCache(MountainDetailRecordUtil.CACHE_ID)
 
 	args.filterOut = args.filterOut.split("|")
 	maxDurationMin = MountainDetailRecordUtil.getMinutesFromHHMM(args.maxTime)
@@ -599,8 +804,8 @@ if __name__=="__main__":
 	urlList={}
 	for aUrl in args.args:
 		urlList[aUrl] = aUrl
-	for aUrl in urlList.keys():
-		anInfo = MountainDetailRecordUtil(aUrl)
+	fetcher = DetailRecordFetcher(args.jobs, args.jobsPerHost)
+	for aUrl, anInfo in fetcher.fetch(urlList.keys()):
 
 		# Filter out non-parsable case (login required, etc.)
 		if args.noOutputIfNone and not anInfo.isValid():
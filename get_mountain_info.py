@@ -21,17 +21,17 @@ import time
 import json
 import itertools
 import os
-from mountainRecordUtil import JsonCache, NumUtil, StrUtil, ExecUtil, MountainRecordUtil
+from mountainRecordUtil import JsonCache, JsonCacheFactory, CacheCodec, HttpUtil, HtmlUtil, NumUtil, StrUtil, ExecUtil, MountainRecordUtil
 
 
-import requests
-from bs4 import BeautifulSoup
-
 class ParserMountainInfoBase:
 	TARGET_URL = "DUMMY"
 
 	NUM_OF_CACHE = 1000
 	CACHE_ID = "mountainInfo"
+	# the info rarely changes. expired pages are revalidated with the validators then mostly 304 Not Modified
+	CACHE_EXPIRE_HOURS = 24 * 30
+	PARSE_ONLY = None # SoupStrainer of the subtrees which _parseMountainInfo reads
 
 	def __init__(self, cache):
 		self.cache = cache
@@ -43,19 +43,29 @@ class ParserMountainInfoBase:
 		return { "altitude":None, "location":None,  "category":[], "description":"" }
 
 	def parseMountainInfo(self, recordUrl):
-		result = self.cache.restoreFromCache(recordUrl)
+		result, entry = self.cache.restoreFromCacheWithEntry(recordUrl)
 		if not result:
 			result = self._getBaseResult()
 			soup = None
+			validators = None
 			try:
-				res = requests.get(recordUrl)
-				soup = BeautifulSoup(res.text, 'html.parser')
+				# revalidate the expired page then not modified page isn't parsed again
+				res = HttpUtil.get(recordUrl, headers=HttpUtil.getConditionalHeaders(entry.get("validators") if entry else None))
+				if HttpUtil.isNotModified(res):
+					_result = self.cache.touchCache(recordUrl, entry) if entry else None
+					if _result:
+						return _result
+					# 304 but nothing cached to revalidate. fetched again without the validators
+					res = HttpUtil.get(recordUrl)
+				if not HttpUtil.isNotModified(res):
+					validators = HttpUtil.getValidators(res)
+					soup = HtmlUtil.parse(res.text, self.PARSE_ONLY)
 			except:
 				pass
 
 			if soup:
 				result = self._parseMountainInfo(soup, result)
-				self.cache.storeToCache(recordUrl, result)
+				self.cache.storeToCache(recordUrl, result, validators)
 
 		return result
 
@@ -132,7 +142,7 @@ class MountainInfoUtilYamareco(ParserMountainInfoBase):
 					pos = tag.find("<h3>")
 					if pos!=None:
 						tag = tag[0:pos]
-						soup_tag = BeautifulSoup(tag, 'html.parser')
+						soup_tag = HtmlUtil.parse(tag)
 						text = soup_tag.get_text(separator=' ', strip=True)
 						if text:
 							text = str(text).strip()
@@ -176,7 +186,7 @@ def dump_per_category(result):
 class MountainInfo:
 	def __init__(self):
 		self.recUtil = recUtil = MountainRecordUtil()
-		self.cache = cache = JsonCache(os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, ParserMountainInfoBase.CACHE_ID), JsonCache.CACHE_INFINITE, ParserMountainInfoBase.NUM_OF_CACHE)
+		self.cache = cache = JsonCacheFactory.create(os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, ParserMountainInfoBase.CACHE_ID), ParserMountainInfoBase.CACHE_EXPIRE_HOURS, ParserMountainInfoBase.NUM_OF_CACHE, format=CacheCodec.FORMAT_COMPACT)
 
 		self.parsers = parsers = []
 		parsers.append( MountainInfoUtilYamareco(cache) )
@@ -13,15 +13,14 @@
 #   limitations under the License.
 
 import sys
-import requests
-from bs4 import BeautifulSoup
 import re
+from mountainRecordUtil import HttpUtil, HtmlUtil
 
 def getLinks(articleUrl, result=None):
   if result == None:
     result = []
-  res = requests.get(articleUrl)
-  soup = BeautifulSoup(res.text, 'html.parser')
+  res = HttpUtil.get(articleUrl)
+  soup = HtmlUtil.parse(res.text)
   rows = soup.select('table.ptlist tbody tr')
   for row in rows:
     name = str(row.select_one('td:nth-of-type(2) a').text).strip()
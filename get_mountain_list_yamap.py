@@ -13,15 +13,14 @@
 #   limitations under the License.
 
 import sys
-import requests
-from bs4 import BeautifulSoup
 import re
+from mountainRecordUtil import HttpUtil, HtmlUtil
 
 def getLinks(articleUrl, result=None):
   if result == None:
     result = []
-  res = requests.get(articleUrl)
-  soup = BeautifulSoup(res.text, 'html.parser')
+  res = HttpUtil.get(articleUrl)
+  soup = HtmlUtil.parse(res.text)
   rows = soup.find_all('h3', class_='markuplint-ignore-heading-levels css-fsrr9j')
   for row in rows:
     name = row.text.strip()
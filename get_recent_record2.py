@@ -16,8 +16,6 @@ import argparse
 import mountainDic
 import sys
 import subprocess
-import requests
-from bs4 import BeautifulSoup
 from datetime import timedelta, datetime
 import csv
 import json
@@ -27,11 +25,17 @@ import re
 import copy
 import time
 import shlex
-from mountainRecordUtil import JsonCache, NumUtil, StrUtil, ExecUtil
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from mountainRecordUtil import JsonCache, JsonCacheFactory, CacheCodec, HttpUtil, HtmlUtil, NumUtil, StrUtil, ExecUtil
 
 
 class ParserBase:
 	TARGET_URL = "DUMMY"
+	PARSE_ONLY = None # SoupStrainer of the subtrees which _parseRecentRecord reads
+
 	def __init__(self):
 		pass
 
@@ -46,19 +50,30 @@ class ParserBase:
 			pass
 		return date_parsed
 
-	def parseRecentRecord(self, recordUrl):
+	def fetchRecentRecord(self, recordUrl, validators = None):
+		# returns (result, validators, notModified). validators of the cached page make the request conditional
 		result = []
+		newValidators = None
+		notModified = False
 
 		soup = None
 		try:
-			res = requests.get(recordUrl)
-			soup = BeautifulSoup(res.text, 'html.parser')
+			res = HttpUtil.get(recordUrl, headers=HttpUtil.getConditionalHeaders(validators))
+			if HttpUtil.isNotModified(res):
+				notModified = True
+			else:
+				newValidators = HttpUtil.getValidators(res)
+				soup = HtmlUtil.parse(res.text, self.PARSE_ONLY)
 		except:
 			pass
 
 		if soup:
 			result = self._parseRecentRecord(soup, result)
 
+		return result, newValidators, notModified
+
+	def parseRecentRecord(self, recordUrl):
+		result, _, _ = self.fetchRecentRecord(recordUrl)
 		return result
 
 	def _parseRecentRecord(self, soup, result):
@@ -236,9 +251,14 @@ class MountainRecordUtilYamareco(ParserBase):
 
 class MountainRecordUtil:
 	MOUNTAIN_DIC_PATH = os.path.join( os.path.dirname(os.path.realpath(__file__)), "mountain_dic.json" )
+	NUM_OF_MEMORY_CACHE = 100
+	# the records are expired after 4 hours and served as stale up to 12 hours old while they are refreshed
+	STALE_WHILE_REVALIDATE_HOURS = 8
 
-	def __init__(self):
-		self.cache = JsonCache(os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, "mountainRecord"), 4)
+	def __init__(self, staleWhileRevalidate = False):
+		# staleWhileRevalidate: return expired records immediately and refresh them in background
+		self.staleWhileRevalidate = staleWhileRevalidate
+		self.cache = JsonCacheFactory.create(os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, "mountainRecord"), 4, memoryCacheEntries=self.NUM_OF_MEMORY_CACHE, format=CacheCodec.FORMAT_COMPACT, staleWhileRevalidateHour=self.STALE_WHILE_REVALIDATE_HOURS if staleWhileRevalidate else None)
 
 		parser = self.parser = []
 		parser.append( MountainRecordUtilYamareco() )
@@ -292,36 +312,131 @@ class MountainRecordUtil:
 
 		return result
 
-	def parseRecentRecord(self, recordUrl):
-		result = []
+	def _fetchRecentRecordToCache(self, recordUrl, parser):
+		# returns the cache aware data. the page isn't parsed again if it's not modified since the cached one
+		_result = None
+		entry = self.cache.restoreEntry(recordUrl)
+		result, validators, notModified = parser.fetchRecentRecord(recordUrl, entry["validators"] if entry else None)
+		if notModified:
+			_result = self.cache.touchCache(recordUrl, entry) if entry else None
+			if _result is None:
+				# 304 but nothing cached to revalidate. fetched again without the validators
+				result, validators, notModified = parser.fetchRecentRecord(recordUrl)
+		if _result is None and not notModified and result:
+			# store to cache
+			_result = self._getCacheAwareData(result)
+			if _result:
+				self.cache.storeToCache(recordUrl, _result, validators)
+		return _result
 
-		parser = None
+	def _getParser(self, recordUrl):
 		for _parser in self.parser:
 			if _parser.canHandle(recordUrl):
-				parser = _parser
-				break
+				return _parser
+		return None
+
+	def restoreRecentRecord(self, recordUrl):
+		# returns None if it's not cached (or expired without staleWhileRevalidate)
+		result = None
 
+		parser = self._getParser(recordUrl)
 		if parser:
 			# try to get cache
-			_result = self.cache.restoreFromCache(recordUrl)
+			if self.staleWhileRevalidate:
+				_result, isStale = self.cache.restoreFromCacheOrRevalidate(recordUrl, lambda: self._fetchRecentRecordToCache(recordUrl, parser))
+			else:
+				_result = self.cache.restoreFromCache(recordUrl)
 			if _result:
-				# cache is found
 				result = self._ensureRestoredDataFromCache(_result, parser)
-			else:
-				# cache is NOT found
-				result = parser.parseRecentRecord(recordUrl)
-				if result:
-					# store to cache
-					_result = self._getCacheAwareData(result)
-					if _result:
-						self.cache.storeToCache(recordUrl, _result)
+
+		return result
+
+	def _fetchRecentRecord(self, recordUrl):
+		# fetches without looking up the cache. the result is stored to the cache
+		result = []
+		parser = self._getParser(recordUrl)
+		if parser:
+			_result = self._fetchRecentRecordToCache(recordUrl, parser)
+			if _result:
+				result = self._ensureRestoredDataFromCache(_result, parser)
+		return result
+
+	def parseRecentRecord(self, recordUrl):
+		result = self.restoreRecentRecord(recordUrl)
+
+		if result is None:
+			# cache is NOT found or expired
+			result = self._fetchRecentRecord(recordUrl)
 
 		return result
 
 
+class AsyncRecentRecordFetcher:
+	# schedules the list page fetches on an asyncio loop with bounded concurrency and per-domain politeness delay.
+	# the blocking fetch and parse run in threads (asyncio.to_thread) then the results are parsed as they arrive.
+	DEFAULT_JOBS = 1
+	DEFAULT_DELAY_SEC = 0.5
+
+	def __init__(self, recUtil, jobs = DEFAULT_JOBS, delay = DEFAULT_DELAY_SEC):
+		self.recUtil = recUtil
+		self.jobs = max(1, jobs)
+		self.delay = max(0, delay)
+		self._semaphore = None
+		self._domainLocks = {}
+		self._lastRequest = {}
+
+	async def _waitPoliteness(self, url):
+		domain = urlparse(url).netloc
+		if not domain in self._domainLocks:
+			self._domainLocks[domain] = asyncio.Lock()
+		async with self._domainLocks[domain]:
+			wait = self._lastRequest.get(domain, 0) + self.delay - time.monotonic()
+			if wait > 0:
+				await asyncio.sleep(wait)
+			self._lastRequest[domain] = time.monotonic()
+
+	async def _parseRecentRecord(self, url):
+		if not self._semaphore:
+			self._semaphore = asyncio.Semaphore(self.jobs)
+		# cache hit doesn't wait for the semaphore and the politeness delay
+		result = await asyncio.to_thread(self.recUtil.restoreRecentRecord, url)
+		if result is None:
+			async with self._semaphore:
+				await self._waitPoliteness(url)
+				# the cache is already missed above then it's not restored again
+				result = await asyncio.to_thread(self.recUtil._fetchRecentRecord, url)
+		return result
+
+	def parseRecentRecords(self, urls):
+		# yields (url, results) in the order of urls as soon as the preceding ones are done
+		if self.jobs <= 1:
+			for url in urls:
+				yield url, self.recUtil.parseRecentRecord(url)
+			return
+
+		loop = asyncio.new_event_loop()
+		loop.set_default_executor(ThreadPoolExecutor(max_workers=self.jobs))
+		thread = threading.Thread(target=loop.run_forever, daemon=True)
+		thread.start()
+		futures = []
+		try:
+			futures = [ asyncio.run_coroutine_threadsafe(self._parseRecentRecord(url), loop) for url in urls ]
+			for url, future in zip(urls, futures):
+				yield url, future.result()
+		finally:
+			for future in futures:
+				future.cancel()
+			loop.call_soon_threadsafe(loop.stop)
+			thread.join()
+			loop.close()
+
+
 
 
 class MountainFilterUtil:
+  DEFAULT_ALTITUDE_MIN = 0
+  DEFAULT_ALTITUDE_MAX = 9000
+
   @staticmethod
   def openCsv( fileName, delimiter="," ):
     result = []
@@ -392,6 +507,11 @@ class MountainFilterUtil:
   		pass
   	return int(result)
 
+  @staticmethod
+  def isAltitudeInRange( altitude, altitudeMin = DEFAULT_ALTITUDE_MIN, altitudeMax = DEFAULT_ALTITUDE_MAX ):
+    # altitude is the value of getAltitude()
+    return altitude>=altitudeMin and altitude<=altitudeMax
+
   @staticmethod
   def shoudExcludeRecord( fields, excludes ):
   	if not aResult:
@@ -419,9 +539,11 @@ if __name__=="__main__":
 	parser.add_argument('-e', '--exclude', action='append', default=[], help='specify excluding mountain list file e.g. climbedMountains.lst')
 	parser.add_argument('-i', '--include', action='append', default=[], help='specify including mountain list file e.g. climbedMountains.lst')
 
-	parser.add_argument('-g', '--altitudeMin', action='store', default=0, type=int, help='Min altitude')
-	parser.add_argument('-u', '--altitudeMax', action='store', default=9000, type=int, help='Max altitude')
+	parser.add_argument('-g', '--altitudeMin', action='store', default=MountainFilterUtil.DEFAULT_ALTITUDE_MIN, type=int, help='Min altitude')
+	parser.add_argument('-u', '--altitudeMax', action='store', default=MountainFilterUtil.DEFAULT_ALTITUDE_MAX, type=int, help='Max altitude')
 	parser.add_argument('-p', '--providers', action='store', default="yamareco|yamap", help='Provider yamareco|yamap')
+	parser.add_argument('-j', '--jobs', action='store', default=AsyncRecentRecordFetcher.DEFAULT_JOBS, type=int, help='specify the number of concurrent list page fetches')
+	parser.add_argument('--delay', action='store', default=AsyncRecentRecordFetcher.DEFAULT_DELAY_SEC, type=float, help='specify the politeness delay [sec] between the fetches to the same domain with --jobs')
 
 	args = parser.parse_args()
 	recUtil = MountainRecordUtil()
@@ -434,26 +556,31 @@ if __name__=="__main__":
 		mountainList.extend( recUtil.getMountainsWithMountainName( aMountainName ) )
 	mountainList = sorted(mountainList, key=lambda x: ( MountainFilterUtil.getAltitude(x["altitude"]), x["name"] ), reverse=True)
 
+	targetMountains = []
 	for aMountain in mountainList:
 		altitude = MountainFilterUtil.getAltitude( aMountain["altitude"] )
-		if altitude>=args.altitudeMin and altitude<=args.altitudeMax:
+		if MountainFilterUtil.isAltitudeInRange(altitude, args.altitudeMin, args.altitudeMax):
 			if shoudHandleUrl(aMountain["url"], providers):
-				results = recUtil.parseRecentRecord( aMountain["url"] )
-				n = 0
-				for aResult in results:
-					if MountainFilterUtil.shoudExcludeRecord([aMountain["name"], aResult["title"], aResult["prefecture"]], excludes):
-						continue
-					if aResult and ("date" in aResult) and aResult["date"]:
-						date_diff = today - aResult["date"]
-						if date_diff.days < args.filterDays:
-							n=n+1
-							if n<=args.numOpen:
-								url = aResult["url"]
-								if args.urlOnly:
-									print( url )
-								else:
-									print( f'name:{aMountain["name"]}, yomi:{aMountain["yomi"]}, altitude:{altitude} : {url} : {aResult["date_text"]} : {aResult["title"]}' )
-								if args.openUrl:
-									if n>=2:
-										time.sleep(1)
-									ExecUtil.open( url )
+				targetMountains.append( aMountain )
+
+	fetcher = AsyncRecentRecordFetcher(recUtil, args.jobs, args.delay)
+	for aMountain, (_, results) in zip(targetMountains, fetcher.parseRecentRecords([ aMountain["url"] for aMountain in targetMountains ])):
+		altitude = MountainFilterUtil.getAltitude( aMountain["altitude"] )
+		n = 0
+		for aResult in results:
+			if MountainFilterUtil.shoudExcludeRecord([aMountain["name"], aResult["title"], aResult["prefecture"]], excludes):
+				continue
+			if aResult and ("date" in aResult) and aResult["date"]:
+				date_diff = today - aResult["date"]
+				if date_diff.days < args.filterDays:
+					n=n+1
+					if n<=args.numOpen:
+						url = aResult["url"]
+						if args.urlOnly:
+							print( url )
+						else:
+							print( f'name:{aMountain["name"]}, yomi:{aMountain["yomi"]}, altitude:{altitude} : {url} : {aResult["date_text"]} : {aResult["title"]}' )
+						if args.openUrl:
+							if n>=2:
+								time.sleep(1)
+							ExecUtil.open( url )
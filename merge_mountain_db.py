@@ -15,16 +15,15 @@
 #!/usr/bin/env python3
 
 import copy
-import importlib.util
 import pprint
 import sys
 
+from mountain_db_store import load_db_module
+
 
 def load_py(filename):
-    spec = importlib.util.spec_from_file_location("mod", filename)
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)
-    return copy.deepcopy(mod.MOUNTAINS)
+    # .py or .sqlite
+    return load_db_module(filename).MOUNTAINS
 
 
 def weighted_average(v1, n1, v2, n2):
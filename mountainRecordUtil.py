@@ -21,6 +21,43 @@ from datetime import timedelta, datetime
 import glob
 import shlex
 import time
+import sqlite3
+import threading
+import atexit
+from collections import OrderedDict
+import queue
+import gzip
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+
+try:
+  import brotli
+except:
+  try:
+    import brotlicffi as brotli
+  except:
+    brotli = None
+
+try:
+  import zstandard
+except:
+  zstandard = None
+
+try:
+  import msgpack
+except:
+  msgpack = None
+
+from bs4 import BeautifulSoup
+import html
+
+try:
+  import lxml
+except:
+  lxml = None
 
 
 class MountainRecordUtil:
@@ -52,15 +89,133 @@ class MountainRecordUtil:
     return result
 
 
+class CacheCodec:
+  FORMAT_JSON = "json"        # indent=4 json (default, human readable)
+  FORMAT_COMPACT = "compact"  # compact json
+  FORMAT_GZIP = "gzip"        # compact json + gzip
+  FORMAT_ZSTD = "zstd"        # compact json + zstd (gzip if zstandard is not installed)
+  FORMAT_MSGPACK = "msgpack"  # msgpack (compact json if msgpack is not installed)
+
+  GZIP_MAGIC = b'\x1f\x8b'
+  ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+  MSGPACK_MAGIC = b'\xc1MP' # 0xc1 is never used by msgpack and can't start utf-8 json
+
+  @staticmethod
+  def getAvailableFormat(format = None):
+    result = format if format else CacheCodec.FORMAT_JSON
+    if result == CacheCodec.FORMAT_ZSTD and not zstandard:
+      result = CacheCodec.FORMAT_GZIP
+    if result == CacheCodec.FORMAT_MSGPACK and not msgpack:
+      result = CacheCodec.FORMAT_COMPACT
+    return result
+
+  @staticmethod
+  def encode(data, format = None):
+    format = CacheCodec.getAvailableFormat(format)
+    if format == CacheCodec.FORMAT_JSON:
+      return json.dumps(data, indent = 4, ensure_ascii=False).encode('UTF-8')
+    if format == CacheCodec.FORMAT_MSGPACK:
+      return CacheCodec.MSGPACK_MAGIC + msgpack.packb(data, use_bin_type=True)
+
+    result = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('UTF-8')
+    if format == CacheCodec.FORMAT_GZIP:
+      result = gzip.compress(result, mtime=0)
+    elif format == CacheCodec.FORMAT_ZSTD:
+      result = zstandard.ZstdCompressor().compress(result)
+    return result
+
+  @staticmethod
+  def decode(payload):
+    # the format is detected from the payload then caches written with any format can be read
+    if isinstance(payload, str):
+      return json.loads(payload)
+    # e.g. the cache dir shared with the machine which has zstandard. the readers treat this as a cache miss
+    if payload.startswith(CacheCodec.ZSTD_MAGIC) and not zstandard:
+      raise ValueError("zstd cache payload needs zstandard package")
+    if payload.startswith(CacheCodec.MSGPACK_MAGIC) and not msgpack:
+      raise ValueError("msgpack cache payload needs msgpack package")
+
+    if payload.startswith(CacheCodec.GZIP_MAGIC):
+      payload = gzip.decompress(payload)
+    elif payload.startswith(CacheCodec.ZSTD_MAGIC):
+      payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif payload.startswith(CacheCodec.MSGPACK_MAGIC):
+      return msgpack.unpackb(payload[len(CacheCodec.MSGPACK_MAGIC):], raw=False, strict_map_key=False)
+    return json.loads(payload)
+
+
+class MemoryLruCache:
+  # bounded in-memory LRU. bounded by the number of entries and/or the (estimated) bytes
+  def __init__(self, maxEntries = None, maxBytes = None):
+    self.maxEntries = maxEntries
+    self.maxBytes = maxBytes
+    self._items = OrderedDict()
+    self._bytes = 0
+    self._lock = threading.RLock()
+
+  def get(self, key):
+    result = None
+    with self._lock:
+      if key in self._items:
+        self._items.move_to_end(key)
+        result = self._items[key][0]
+    return result
+
+  def put(self, key, value, size = 0):
+    with self._lock:
+      self.remove(key)
+      self._items[key] = (value, size)
+      self._bytes += size
+      while self._items and ( (self.maxEntries and len(self._items) > self.maxEntries) or (self.maxBytes and self._bytes > self.maxBytes) ):
+        _, (_, removedSize) = self._items.popitem(last=False)
+        self._bytes -= removedSize
+
+  def remove(self, key):
+    with self._lock:
+      if key in self._items:
+        _, size = self._items.pop(key)
+        self._bytes -= size
+
+  def clear(self):
+    with self._lock:
+      self._items.clear()
+      self._bytes = 0
+
+  def __len__(self):
+    return len(self._items)
+
+
 class JsonCache:
   DEFAULT_CACHE_BASE_DIR = os.path.expanduser("~")+"/.cache"
   DEFAULT_CACHE_EXPIRE_HOURS = 1 # an hour
   CACHE_INFINITE = -1
+  # recency of the cache files (oldest first) is persisted here instead of globbing the dir on every store
+  MANIFEST_FILENAME = ".lru_manifest.json"
+  MANIFEST_SAVE_INTERVAL = 50
+  NUM_OF_REVALIDATE_WORKERS = 2
+  _revalidateQueue = None
+  _revalidateLock = threading.Lock()
 
-  def __init__(self, cacheDir = None, expireHour = None, numOfCache = None):
+  def __init__(self, cacheDir = None, expireHour = None, numOfCache = None, memoryCacheEntries = None, memoryCacheBytes = None, format = None, staleWhileRevalidateHour = None):
   	self.cacheBaseDir = cacheDir if cacheDir else JsonCache.DEFAULT_CACHE_BASE_DIR
   	self.expireHour = expireHour if expireHour else JsonCache.DEFAULT_CACHE_EXPIRE_HOURS
   	self.numOfCache = numOfCache if numOfCache else JsonCache.CACHE_INFINITE
+  	self.format = CacheCodec.getAvailableFormat(format)
+  	self._lock = threading.RLock()
+  	self._lruIndex = None
+  	self._lruDirtyCount = 0
+  	# optional 1st tier in front of the disk. write through and keeps the parsed lastUpdate
+  	self._memoryCache = None
+  	if memoryCacheEntries or memoryCacheBytes:
+  		self._memoryCache = MemoryLruCache(memoryCacheEntries, memoryCacheBytes)
+  	# expired entries within this extra hours are returned as stale by restoreFromCacheWithStale()
+  	self.staleWhileRevalidateHour = staleWhileRevalidateHour
+  	self._revalidating = set()
+  	self.stats = {
+  		"memory": {"hit":0, "miss":0},
+  		"disk": {"hit":0, "miss":0},
+  		"stale": 0,
+  	}
 
   def ensureCacheStorage(self):
     if not os.path.exists(self.cacheBaseDir):
@@ -80,58 +235,282 @@ class JsonCache:
   def getCachePath(self, url):
     return os.path.join(self.cacheBaseDir, self.getCacheFilename(url))
 
+  def getManifestPath(self):
+    return os.path.join(self.cacheBaseDir, self.MANIFEST_FILENAME)
+
+  def _getLruIndex(self):
+    with self._lock:
+      if self._lruIndex is None:
+        manifest = []
+        try:
+          with open(self.getManifestPath(), 'r', encoding='UTF-8') as f:
+            manifest = json.load(f)
+            f.close()
+        except:
+          pass
+
+        files = set( os.path.basename(aFile) for aFile in glob.glob(f'{self.cacheBaseDir}/*.json') )
+        index = OrderedDict()
+        for aFile in manifest:
+          if aFile in files:
+            index[aFile] = True
+        # files unknown to the manifest (1st run or written by another process) are ordered by mtime once
+        unknownFiles = [ os.path.join(self.cacheBaseDir, aFile) for aFile in files if not aFile in index ]
+        for aFile in sorted(unknownFiles, key=os.path.getmtime):
+          index[os.path.basename(aFile)] = True
+
+        self._lruIndex = index
+        atexit.register(self.saveLruIndex)
+      return self._lruIndex
+
+  def saveLruIndex(self):
+    with self._lock:
+      if self._lruIndex is not None and self._lruDirtyCount:
+        try:
+          self.ensureCacheStorage()
+          manifestPath = self.getManifestPath()
+          with open(manifestPath+".tmp", 'w', encoding='UTF-8') as f:
+            json.dump(list(self._lruIndex.keys()), f)
+            f.close()
+          os.replace(manifestPath+".tmp", manifestPath)
+          self._lruDirtyCount = 0
+        except:
+          pass
+
+  def _touchLruIndex(self, url):
+    if self.numOfCache!=self.CACHE_INFINITE:
+      with self._lock:
+        index = self._getLruIndex()
+        filename = self.getCacheFilename(url)
+        index[filename] = True
+        index.move_to_end(filename)
+        self._lruDirtyCount += 1
+        if self._lruDirtyCount >= self.MANIFEST_SAVE_INTERVAL:
+          self.saveLruIndex()
+
+  def _touchRecency(self, url):
+    # in-memory manifest update. it's persisted with the other touches
+    self._touchLruIndex(url)
+
   def limitNumOfCacheFiles(self):
-  	if self.numOfCache!=self.CACHE_INFINITE:
-	  	files = glob.glob(f'{self.cacheBaseDir}/*.json')
-	  	files = sorted(files, key=os.path.getmtime, reverse=True)
-	  	remove_files = files[self.numOfCache:]
-	  	for aRemoveFile in remove_files:
-	  		try:
-		  		os.remove(aRemoveFile)
-		  	except:
-		  		pass
-
-
-  def storeToCache(self, url, result):
-    self.ensureCacheStorage()
+    if self.numOfCache!=self.CACHE_INFINITE:
+      with self._lock:
+        index = self._getLruIndex()
+        while len(index) > self.numOfCache:
+          aRemoveFile, _ = index.popitem(last=False)
+          self._lruDirtyCount += 1
+          try:
+            os.remove(os.path.join(self.cacheBaseDir, aRemoveFile))
+          except:
+            pass
+
+
+  def _writeEntry(self, url, entry):
+    # written to the temporary file and replaced then the readers never see the half written entry even if the process exits while writing
     cachePath = self.getCachePath( url )
-    dt_now = datetime.now()
+    tmpPath = f"{cachePath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmpPath, 'wb') as f:
+      f.write(CacheCodec.encode(entry, self.format))
+      f.close()
+    os.replace(tmpPath, cachePath)
+    self._touchLruIndex(url)
+
+  def _readEntry(self, url):
+    result = None
+    cachePath = self.getCachePath( url )
+    if os.path.exists( cachePath ):
+      with open(cachePath, 'rb') as f:
+        payload = f.read()
+        f.close()
+      try:
+        result = CacheCodec.decode(payload)
+      except ValueError:
+        result = None
+      self._touchLruIndex(url)
+    return result
+
+  def _getEntrySize(self, entry):
+    result = 0
+    if self._memoryCache is not None and self._memoryCache.maxBytes:
+      result = len(json.dumps(entry["data"], ensure_ascii=False).encode('UTF-8'))
+    return result
+
+  def _storeToMemoryCache(self, url, lastUpdate, data):
+    if self._memoryCache is not None:
+      entry = {
+        "lastUpdate": lastUpdate,
+        "data": data
+      }
+      self._memoryCache.put(url, entry, self._getEntrySize(entry))
+
+  def storeToCache(self, url, result, validators = None):
+    self.ensureCacheStorage()
+    dt_now = datetime.now().replace(microsecond=0)
     _result = {
     	"lastUpdate":dt_now.strftime("%Y-%m-%d %H:%M:%S"),
     	"data": result
     }
-    with open(cachePath, 'w', encoding='UTF-8') as f:
-      json.dump(_result, f, indent = 4, ensure_ascii=False)
-      f.close()
+    if validators:
+      _result["validators"] = validators
+    self._writeEntry(url, _result)
+    self._storeToMemoryCache(url, dt_now, result)
     self.limitNumOfCacheFiles()
 
 
-  def isValidCache(self, lastUpdateString):
+  def isValidCacheDatetime(self, lastUpdate):
     result = False
-    lastUpdate = datetime.strptime(lastUpdateString, "%Y-%m-%d %H:%M:%S")
     dt_now = datetime.now()
     if self.expireHour == self.CACHE_INFINITE or ( dt_now < ( lastUpdate+timedelta(hours=self.expireHour) ) ):
       result = True
 
     return result
 
+  def isValidCache(self, lastUpdateString):
+    lastUpdate = datetime.strptime(lastUpdateString, "%Y-%m-%d %H:%M:%S")
+    return self.isValidCacheDatetime(lastUpdate)
+
+  def restoreEntry(self, url):
+    # the stored entry {lastUpdate, data, validators} even if it's expired. lastUpdate is parsed to datetime
+    result = None
+    _result = self._readEntry(url)
+    if _result and "lastUpdate" in _result and "data" in _result:
+      result = {
+        "lastUpdate": datetime.strptime(_result["lastUpdate"], "%Y-%m-%d %H:%M:%S"),
+        "data": _result["data"],
+        "validators": _result.get("validators")
+      }
+    return result
+
+  def restoreFromCacheWithEntry(self, url):
+    # returns (data if it's valid, the entry even if it's expired) then the callers don't read the entry again
+    result = None
+    memoryEntry = None
+
+    if self._memoryCache is not None:
+      memoryEntry = self._memoryCache.get(url)
+      if memoryEntry and self.isValidCacheDatetime( memoryEntry["lastUpdate"] ):
+        self._countStats("memory", "hit")
+        # the hot entries served from memory keep their recency on the disk too
+        self._touchRecency(url)
+        return memoryEntry["data"], memoryEntry
+      self._countStats("memory", "miss")
+
+    entry = self.restoreEntry(url)
+    if entry and self.isValidCacheDatetime( entry["lastUpdate"] ):
+      result = entry["data"]
+      self._storeToMemoryCache(url, entry["lastUpdate"], result)
+
+    self._countStats("disk", "hit" if result is not None else "miss")
+
+    return result, entry if entry else memoryEntry
+
   def restoreFromCache(self, url):
+    return self.restoreFromCacheWithEntry(url)[0]
+
+  def getValidators(self, url):
+    # http validators (etag, lastModified) of the entry even if it's expired
     result = None
-    cachePath = self.getCachePath( url )
-    if os.path.exists( cachePath ):
-	    with open(cachePath, 'r', encoding='UTF-8') as f:
-	      _result = json.load(f)
-	      f.close()
+    entry = self.restoreEntry(url)
+    if entry:
+      result = entry["validators"]
+    return result
 
-	    if "lastUpdate" in _result:
-	      if self.isValidCache( _result["lastUpdate"] ):
-	        result = _result["data"]
+  def _touchEntry(self, url, lastUpdate, entry):
+    # lastUpdate is in the json file then the entry is written again
+    _result = {
+      "lastUpdate": lastUpdate.strftime("%Y-%m-%d %H:%M:%S"),
+      "data": entry["data"]
+    }
+    if entry.get("validators"):
+      _result["validators"] = entry["validators"]
+    self.ensureCacheStorage()
+    self._writeEntry(url, _result)
 
+  def touchCache(self, url, entry = None):
+    # bump lastUpdate of the existing entry (e.g. 304 Not Modified) and return its data.
+    # entry: the one already read by restoreEntry()/restoreFromCacheWithEntry() then it's not read again
+    result = None
+    if entry is None:
+      entry = self.restoreEntry(url)
+    if entry:
+      result = entry["data"]
+      dt_now = datetime.now().replace(microsecond=0)
+      self._touchEntry(url, dt_now, entry)
+      self._storeToMemoryCache(url, dt_now, result)
+      self.limitNumOfCacheFiles()
     return result
 
+  def restoreFromCacheWithStale(self, url):
+    # returns (data, isStale). expired entries are still returned within staleWhileRevalidateHour
+    result, entry = self.restoreFromCacheWithEntry(url)
+    if result is not None:
+      return result, False
+
+    if self.staleWhileRevalidateHour and self.expireHour != self.CACHE_INFINITE:
+      if entry and datetime.now() < entry["lastUpdate"] + timedelta(hours=self.expireHour + self.staleWhileRevalidateHour):
+        self._countStats("stale")
+        return entry["data"], True
+
+    return None, False
+
+  @staticmethod
+  def _getRevalidateQueue():
+    # daemon workers then the exit doesn't wait for the pending refreshes. the dropped ones are revalidated on the next access
+    with JsonCache._revalidateLock:
+      if JsonCache._revalidateQueue is None:
+        JsonCache._revalidateQueue = queue.Queue()
+        for i in range(JsonCache.NUM_OF_REVALIDATE_WORKERS):
+          threading.Thread(target=JsonCache._revalidateWorker, daemon=True).start()
+      return JsonCache._revalidateQueue
+
+  @staticmethod
+  def _revalidateWorker():
+    while True:
+      task = JsonCache._revalidateQueue.get()
+      task()
+
+  def revalidate(self, url, refresher):
+    # refresher() runs in background and is expected to store the refreshed data
+    with JsonCache._revalidateLock:
+      if url in self._revalidating:
+        return False
+      self._revalidating.add(url)
+
+    def _revalidate():
+      try:
+        refresher()
+      except:
+        pass
+      finally:
+        with JsonCache._revalidateLock:
+          self._revalidating.discard(url)
+
+    JsonCache._getRevalidateQueue().put(_revalidate)
+    return True
+
+  def restoreFromCacheOrRevalidate(self, url, refresher):
+    result, isStale = self.restoreFromCacheWithStale(url)
+    if isStale:
+      self.revalidate(url, refresher)
+    return result, isStale
+
+  def _countStats(self, *keys):
+    # the caches are shared by the threads (e.g. the revalidation workers)
+    with self._lock:
+      stats = self.stats
+      for key in keys[:-1]:
+        stats = stats[key]
+      stats[keys[-1]] += 1
+
+  def getStats(self):
+    # the snapshot of the counters
+    with self._lock:
+      return { key: dict(value) if isinstance(value, dict) else value for key, value in self.stats.items() }
+
   @staticmethod
   def clearAllCache(cacheId):
   	files = glob.glob(f'{os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, cacheId)}/*.json')
+  	files.append(os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, cacheId, JsonCache.MANIFEST_FILENAME))
   	for aRemoveFile in files:
   		try:
   			os.remove(aRemoveFile)
@@ -139,6 +518,340 @@ class JsonCache:
   			pass
 
 
+class SqliteJsonCache(JsonCache):
+  # all the entries of a cache id are kept in one sqlite file instead of one json file per url.
+  # updatedAt and lastAccess are indexed then the retention and LRU eviction are done as indexed deletes.
+  DB_FILENAME = "cache.sqlite"
+  # the expired entries are kept (validators for the revalidation and stale data for stale-while-revalidate)
+  # and removed only if they aren't accessed within this hours, independent of expireHour
+  RETENTION_HOURS = 24 * 90
+
+  def __init__(self, cacheDir = None, expireHour = None, numOfCache = None, memoryCacheEntries = None, memoryCacheBytes = None, format = CacheCodec.FORMAT_COMPACT, staleWhileRevalidateHour = None):
+    super().__init__(cacheDir, expireHour, numOfCache, memoryCacheEntries, memoryCacheBytes, format, staleWhileRevalidateHour)
+    self._conn = None
+    self._count = 0
+    # lastAccess of the memory hits. written in a batch instead of an UPDATE per hit
+    self._pendingAccess = {}
+
+  def getDbPath(self):
+    return os.path.join(self.cacheBaseDir, self.DB_FILENAME)
+
+  def _getConnection(self):
+    if not self._conn:
+      self.ensureCacheStorage()
+      conn = sqlite3.connect(self.getDbPath(), timeout=30, isolation_level=None, check_same_thread=False)
+      conn.execute("PRAGMA journal_mode=WAL")
+      conn.execute("PRAGMA synchronous=NORMAL")
+      conn.execute("CREATE TABLE IF NOT EXISTS cache (url TEXT PRIMARY KEY, lastUpdate TEXT NOT NULL, updatedAt REAL NOT NULL, lastAccess REAL NOT NULL, data BLOB NOT NULL)")
+      conn.execute("CREATE INDEX IF NOT EXISTS cache_updatedAt ON cache(updatedAt)")
+      conn.execute("CREATE INDEX IF NOT EXISTS cache_lastAccess ON cache(lastAccess)")
+      columns = [ row[1] for row in conn.execute("PRAGMA table_info(cache)") ]
+      if not "validators" in columns:
+        conn.execute("ALTER TABLE cache ADD COLUMN validators TEXT")
+      self._conn = conn
+      atexit.register(self.flushAccess)
+      self.removeUnusedCache()
+      self._count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    return self._conn
+
+  def removeUnusedCache(self):
+    # the entries of the caches which never expire are kept (only the LRU limit removes them)
+    if self.expireHour != self.CACHE_INFINITE and self.RETENTION_HOURS != self.CACHE_INFINITE:
+      with self._lock:
+        self._getConnection().execute("DELETE FROM cache WHERE lastAccess < ?", (time.time() - self.RETENTION_HOURS * 3600,))
+
+  def _touchRecency(self, url):
+    with self._lock:
+      self._pendingAccess[url] = time.time()
+      if len(self._pendingAccess) >= self.MANIFEST_SAVE_INTERVAL:
+        self.flushAccess()
+
+  def flushAccess(self):
+    with self._lock:
+      if self._pendingAccess and self._conn:
+        pending = self._pendingAccess
+        self._pendingAccess = {}
+        try:
+          self._conn.executemany("UPDATE cache SET lastAccess=MAX(lastAccess, ?) WHERE url=?", [ (lastAccess, url) for url, lastAccess in pending.items() ])
+        except:
+          pass
+
+  def limitNumOfCacheFiles(self):
+    if self.numOfCache!=self.CACHE_INFINITE and self._count > self.numOfCache:
+      with self._lock:
+        self.flushAccess()
+        cur = self._getConnection().execute("DELETE FROM cache WHERE url IN (SELECT url FROM cache ORDER BY lastAccess ASC LIMIT ?)", (self._count - self.numOfCache,))
+        self._count = max(0, self._count - max(0, cur.rowcount))
+
+  def _writeEntry(self, url, entry):
+    now = time.time()
+    data = sqlite3.Binary(CacheCodec.encode(entry["data"], self.format))
+    validators = json.dumps(entry["validators"]) if entry.get("validators") else None
+    with self._lock:
+      conn = self._getConnection()
+      cur = conn.execute("UPDATE cache SET lastUpdate=?, updatedAt=?, lastAccess=?, data=?, validators=? WHERE url=?", (entry["lastUpdate"], now, now, data, validators, url))
+      if cur.rowcount == 0:
+        conn.execute("INSERT OR REPLACE INTO cache (url, lastUpdate, updatedAt, lastAccess, data, validators) VALUES (?, ?, ?, ?, ?, ?)", (url, entry["lastUpdate"], now, now, data, validators))
+        self._count += 1
+
+  def _touchEntry(self, url, lastUpdate, entry):
+    # only the columns are updated. the data and the validators aren't written again
+    now = time.time()
+    with self._lock:
+      cur = self._getConnection().execute("UPDATE cache SET lastUpdate=?, updatedAt=?, lastAccess=? WHERE url=?", (lastUpdate.strftime("%Y-%m-%d %H:%M:%S"), now, now, url))
+    if cur.rowcount == 0:
+      # removed since it's read
+      super()._touchEntry(url, lastUpdate, entry)
+
+  def _readEntry(self, url):
+    result = None
+    with self._lock:
+      conn = self._getConnection()
+      row = conn.execute("SELECT lastUpdate, data, validators FROM cache WHERE url=?", (url,)).fetchone()
+      if row:
+        conn.execute("UPDATE cache SET lastAccess=? WHERE url=?", (time.time(), url))
+        try:
+          result = {
+            "lastUpdate": row[0],
+            "data": CacheCodec.decode(bytes(row[1]) if isinstance(row[1], (bytes, memoryview)) else row[1])
+          }
+          if row[2]:
+            result["validators"] = json.loads(row[2])
+        except ValueError:
+          result = None
+    return result
+
+  def close(self):
+    with self._lock:
+      self.flushAccess()
+      if self._conn:
+        self._conn.close()
+        self._conn = None
+
+  @staticmethod
+  def clearAllCache(cacheId):
+    dbPath = os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, cacheId, SqliteJsonCache.DB_FILENAME)
+    for aRemoveFile in [dbPath, dbPath+"-wal", dbPath+"-shm"]:
+      try:
+        os.remove(aRemoveFile)
+      except:
+        pass
+
+
+class JsonCacheFactory:
+  # backend is selected by the argument or MOUNTAIN_RECORD_CACHE_BACKEND=json|sqlite
+  BACKEND_ENV = "MOUNTAIN_RECORD_CACHE_BACKEND"
+  BACKEND_JSON = "json"
+  BACKEND_SQLITE = "sqlite"
+
+  @staticmethod
+  def getBackend(backend = None):
+    if not backend:
+      backend = os.getenv(JsonCacheFactory.BACKEND_ENV, JsonCacheFactory.BACKEND_JSON)
+    return str(backend).strip().lower()
+
+  @staticmethod
+  def create(cacheDir = None, expireHour = None, numOfCache = None, backend = None, **kwargs):
+    if JsonCacheFactory.getBackend(backend) == JsonCacheFactory.BACKEND_SQLITE:
+      return SqliteJsonCache(cacheDir, expireHour, numOfCache, **kwargs)
+    return JsonCache(cacheDir, expireHour, numOfCache, **kwargs)
+
+  @staticmethod
+  def clearAllCache(cacheId):
+    JsonCache.clearAllCache(cacheId)
+    SqliteJsonCache.clearAllCache(cacheId)
+
+
+class HttpUtil:
+  # pooled sessions per host then the keep-alive connections (and TLS sessions) are reused across the fetches
+  DEFAULT_TIMEOUT = (10, 30) # (connect, read) seconds
+  DEFAULT_RETRY = 3
+  DEFAULT_BACKOFF_FACTOR = 0.5
+  RETRY_STATUS = [429, 500, 502, 503, 504]
+  POOL_MAXSIZE = 10
+
+  COOKIE_DIR = os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, "httpCookies")
+
+  timeout = DEFAULT_TIMEOUT
+  retry = DEFAULT_RETRY
+  backoffFactor = DEFAULT_BACKOFF_FACTOR
+  rateLimiter = None # any object which has acquire(url). it's called before each request and may block
+  _sessions = {}
+  _lock = threading.Lock()
+
+  @staticmethod
+  def configure(timeout = None, retry = None, backoffFactor = None, rateLimiter = None):
+    # should be called before the 1st fetch since the existing sessions keep their retry policy
+    if timeout is not None:
+      HttpUtil.timeout = timeout
+    if retry is not None:
+      HttpUtil.retry = retry
+    if backoffFactor is not None:
+      HttpUtil.backoffFactor = backoffFactor
+    if rateLimiter is not None:
+      HttpUtil.rateLimiter = rateLimiter
+
+  @staticmethod
+  def getAcceptEncoding():
+    result = "gzip, deflate"
+    if brotli:
+      result = result + ", br"
+    return result
+
+  @staticmethod
+  def getSession(url):
+    host = urlparse(url).netloc
+    with HttpUtil._lock:
+      if not host in HttpUtil._sessions:
+        session = requests.Session()
+        retry = Retry(
+          total = HttpUtil.retry,
+          backoff_factor = HttpUtil.backoffFactor,
+          status_forcelist = HttpUtil.RETRY_STATUS,
+          allowed_methods = ["GET", "HEAD"],
+          respect_retry_after_header = True,
+          raise_on_status = False,
+        )
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = HttpUtil.POOL_MAXSIZE, max_retries = retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Accept-Encoding"] = HttpUtil.getAcceptEncoding()
+        HttpUtil._loadCookies(host, session)
+        HttpUtil._sessions[host] = session
+      return HttpUtil._sessions[host]
+
+  @staticmethod
+  def _getCookiePath(host):
+    return os.path.join(HttpUtil.COOKIE_DIR, re.sub(r'[^a-zA-Z0-9._-]', '_', host) + ".json")
+
+  @staticmethod
+  def _loadCookies(host, session):
+    cookiePath = HttpUtil._getCookiePath(host)
+    if os.path.exists(cookiePath):
+      try:
+        with open(cookiePath, 'r', encoding='UTF-8') as f:
+          cookies = json.load(f)
+          f.close()
+        now = time.time()
+        for aCookie in cookies:
+          if not aCookie.get("expires") or aCookie["expires"] > now:
+            session.cookies.set_cookie( requests.cookies.create_cookie(**aCookie) )
+      except:
+        pass
+
+  @staticmethod
+  def setCookies(url, cookies):
+    # cookies exported from the browser (e.g. WebDriver.get_cookies() after the login) are used by the plain requests and persisted with their expiry
+    host = urlparse(url).netloc
+    session = HttpUtil.getSession(url)
+    _cookies = []
+    for aCookie in cookies:
+      _aCookie = {
+        "name": aCookie["name"],
+        "value": aCookie["value"],
+        "domain": aCookie.get("domain", host),
+        "path": aCookie.get("path", "/"),
+        "secure": aCookie.get("secure", False),
+        "expires": aCookie.get("expiry", aCookie.get("expires")),
+      }
+      session.cookies.set_cookie( requests.cookies.create_cookie(**_aCookie) )
+      _cookies.append( _aCookie )
+
+    try:
+      os.makedirs(HttpUtil.COOKIE_DIR, exist_ok=True)
+      fd = os.open(HttpUtil._getCookiePath(host), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+      with os.fdopen(fd, 'w', encoding='UTF-8') as f:
+        json.dump(_cookies, f)
+        f.close()
+    except:
+      pass
+
+  @staticmethod
+  def get(url, headers = None, timeout = None, **kwargs):
+    if HttpUtil.rateLimiter:
+      HttpUtil.rateLimiter.acquire(url)
+    return HttpUtil.getSession(url).get(url, headers = headers, timeout = timeout if timeout else HttpUtil.timeout, **kwargs)
+
+  @staticmethod
+  def getValidators(res):
+    # validators to revalidate the cached page by the conditional request
+    result = {}
+    if res is not None:
+      etag = res.headers.get("ETag")
+      if etag:
+        result["etag"] = etag
+      lastModified = res.headers.get("Last-Modified")
+      if lastModified:
+        result["lastModified"] = lastModified
+    return result
+
+  @staticmethod
+  def getConditionalHeaders(validators):
+    result = {}
+    if validators:
+      if "etag" in validators:
+        result["If-None-Match"] = validators["etag"]
+      if "lastModified" in validators:
+        result["If-Modified-Since"] = validators["lastModified"]
+    return result
+
+  @staticmethod
+  def isNotModified(res):
+    return res is not None and res.status_code == 304
+
+
+class HtmlUtil:
+  # html.parser by default. lxml (opt-in) builds the tree much faster. The strainer (opt-in) builds only the subtrees which the parser reads
+  PARSER_HTML = "html.parser"
+  PARSER_LXML = "lxml"
+  ENV_PARSER = "MOUNTAIN_RECORD_HTML_PARSER"
+  ENV_STRAINER = "MOUNTAIN_RECORD_HTML_STRAINER"
+  RE_TITLE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+  _parser = None
+  _useStrainer = None
+
+  @staticmethod
+  def configure(parser = None, useStrainer = None):
+    if parser is not None:
+      HtmlUtil._parser = HtmlUtil._getAvailableParser(parser)
+    if useStrainer is not None:
+      HtmlUtil._useStrainer = useStrainer
+
+  @staticmethod
+  def _getAvailableParser(parser):
+    if parser == HtmlUtil.PARSER_LXML and not lxml:
+      parser = HtmlUtil.PARSER_HTML
+    return parser
+
+  @staticmethod
+  def getParser():
+    if HtmlUtil._parser is None:
+      HtmlUtil._parser = HtmlUtil._getAvailableParser(os.getenv(HtmlUtil.ENV_PARSER, HtmlUtil.PARSER_HTML))
+    return HtmlUtil._parser
+
+  @staticmethod
+  def isStrainerEnabled():
+    if HtmlUtil._useStrainer is None:
+      HtmlUtil._useStrainer = os.getenv(HtmlUtil.ENV_STRAINER, "").lower() in ("1", "true", "yes", "on")
+    return HtmlUtil._useStrainer
+
+  @staticmethod
+  def parse(text, parseOnly = None):
+    if parseOnly is None or not HtmlUtil.isStrainerEnabled():
+      return BeautifulSoup(text, HtmlUtil.getParser())
+
+    soup = BeautifulSoup(text, HtmlUtil.getParser(), parse_only=parseOnly)
+    if not soup.title:
+      # the title in <head> is out of the strained subtrees but the parsers use it
+      match = HtmlUtil.RE_TITLE.search(text)
+      if match:
+        title = soup.new_tag("title")
+        title.string = html.unescape(match.group(1))
+        soup.insert(0, title)
+    return soup
+
+
 class NumUtil:
 	def toFloat(inStr):
 		inStr = re.sub(r',', "", str(inStr))
@@ -0,0 +1,253 @@
+#   Copyright 2026 hidenorly
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+#!/usr/bin/env python3
+
+import argparse
+import importlib.util
+import json
+import os
+import pathlib
+import pprint
+import sqlite3
+import sys
+import time
+import types
+
+SQLITE_EXTENSIONS = (".sqlite", ".sqlite3", ".db")
+
+DB_VARNAMES = ("MOUNTAINS", "USER_TOZANGUCHI")
+
+
+def is_sqlite_path(path):
+    return str(path).lower().endswith(SQLITE_EXTENSIONS)
+
+
+class MountainDbStore:
+    # one entry (a mountain by uuid or a trailhead by id) per row as json.
+    # the key is the primary key then a partial read doesn't touch the other entries.
+    # the row order is the insertion order of the dict as the .py file keeps.
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _get_connection(self):
+        if not self._conn:
+            # read only then a wrong path doesn't leave an empty db
+            self._conn = sqlite3.connect(
+                f"{pathlib.Path(self.path).resolve().as_uri()}?mode=ro",
+                uri=True,
+            )
+        return self._conn
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_varname(self):
+        row = self._get_connection().execute(
+            "SELECT value FROM meta WHERE name='varname'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self):
+        result = {}
+
+        for key, data in self._get_connection().execute(
+            "SELECT key, data FROM entries ORDER BY rowid"
+        ):
+            result[key] = json.loads(data)
+
+        return result
+
+    def get(self, key, default=None):
+        row = self._get_connection().execute(
+            "SELECT data FROM entries WHERE key=?",
+            (key,),
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_many(self, keys):
+        result = {}
+        keys = list(keys)
+
+        # keep below the sqlite variable limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            for key, data in self._get_connection().execute(
+                f"SELECT key, data FROM entries WHERE key IN ({','.join('?' * len(chunk))}) ORDER BY rowid",
+                chunk,
+            ):
+                result[key] = json.loads(data)
+
+        return result
+
+    def keys(self):
+        return [
+            row[0]
+            for row in self._get_connection().execute(
+                "SELECT key FROM entries ORDER BY rowid"
+            )
+        ]
+
+    def __len__(self):
+        return self._get_connection().execute(
+            "SELECT COUNT(*) FROM entries"
+        ).fetchone()[0]
+
+    def __contains__(self, key):
+        return self._get_connection().execute(
+            "SELECT 1 FROM entries WHERE key=?",
+            (key,),
+        ).fetchone() is not None
+
+    def save(self, varname, data):
+        # written to the temporary file and replaced then the readers never see the half written db
+        self.close()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            conn.executemany(
+                "INSERT INTO meta (name, value) VALUES (?, ?)",
+                [
+                    ("varname", varname),
+                    ("updated_at", str(time.time())),
+                ],
+            )
+            conn.executemany(
+                "INSERT INTO entries (key, data) VALUES (?, ?)",
+                (
+                    (key, json.dumps(value, ensure_ascii=False, separators=(",", ":")))
+                    for key, value in data.items()
+                ),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.replace(tmp_path, self.path)
+
+
+def load_py(path):
+    # the module isn't registered in sys.modules then the loaded dicts aren't shared and no copy is needed
+    spec = importlib.util.spec_from_file_location("db", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def save_py(path, varname, data):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{varname} = ")
+        pprint.pprint(
+            data,
+            stream=f,
+            sort_dicts=False,
+            width=120,
+        )
+
+
+def load_db_module(path):
+    # .py or .sqlite. the result has the variable as the attribute in the both cases e.g. db.MOUNTAINS
+    if is_sqlite_path(path):
+        with MountainDbStore(path) as store:
+            return types.SimpleNamespace(
+                **{store.get_varname(): store.load()}
+            )
+
+    return load_py(path)
+
+
+def load_db(path, varname):
+    if not path or not os.path.exists(path):
+        return {}
+
+    return getattr(load_db_module(path), varname, {})
+
+
+def save_db(path, varname, data):
+    if is_sqlite_path(path):
+        MountainDbStore(path).save(varname, data)
+    else:
+        save_py(path, varname, data)
+
+
+def get_varname(path):
+    result = None
+
+    if is_sqlite_path(path):
+        with MountainDbStore(path) as store:
+            result = store.get_varname()
+    else:
+        module = load_py(path)
+        for varname in DB_VARNAMES:
+            if hasattr(module, varname):
+                result = varname
+                break
+
+    return result
+
+
+def convert(src, dst, varname=None):
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"{src} is not found")
+
+    varname = varname or get_varname(src)
+    if not varname:
+        raise ValueError(f"no db variable ({', '.join(DB_VARNAMES)}) in {src}")
+
+    data = load_db(src, varname)
+    save_db(dst, varname, data)
+
+    return varname, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert mountain_db/user_route_db between .py and .sqlite",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("src", help="source db e.g. mountain_db.py")
+    parser.add_argument("dst", help="destination db e.g. mountain_db.sqlite")
+    parser.add_argument("--varname", default=None, help="MOUNTAINS or USER_TOZANGUCHI (default: detected from src)")
+    args = parser.parse_args()
+
+    try:
+        varname, count = convert(
+            os.path.expanduser(args.src),
+            os.path.expanduser(args.dst),
+            args.varname,
+        )
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{args.src} -> {args.dst} : {varname} {count} entries")
+
+
+if __name__ == "__main__":
+    main()
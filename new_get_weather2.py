@@ -29,7 +29,8 @@ def get_weather(provider, latitude, longitude, altitude, dates, time_range):
         time_range=time_range,
     )
 
-    return provider.get_weather(query)
+    # shares the disk cache with select_mountain.py
+    return cached_get_weather(provider, query)
 
 
 
@@ -69,8 +70,12 @@ def main():
     parser.add_argument('-s', '--stat', action='store_true', help='dump count of mountains per day.')
     parser.add_argument('-w', '--excludeWeatherConditions', action='store', default='rain,snow,thunder', help='specify excluding weather conditions e.g. rain,thunder default is none then all weathers are ok)')
 
+    parser.add_argument("--noWeatherCache", action="store_true", help='Fetch the forecasts without the disk cache')
+
     args = parser.parse_args()
 
+    set_weather_disk_cache(not args.noWeatherCache)
+
     minRouteTime = get_min_from_hhmm(args.minRouteTime)
     maxRouteTime = get_min_from_hhmm(args.maxRouteTime)
     minClimbTime = get_min_from_hhmm(args.minClimbTime)
@@ -15,18 +15,52 @@
 #!/usr/bin/env python3
 
 import argparse
-import importlib.util
+import hashlib
 import os
 import sys
 import math
+import heapq
+import itertools
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from datetime import date, timedelta,datetime
 import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, is_dataclass, make_dataclass
+
+try:
+    import numpy as np
+except:
+    np = None
 
 from get_recent_record2 import MountainRecordUtil,ExecUtil
+from mountainRecordUtil import JsonCache, JsonCacheFactory, CacheCodec
+from mountain_db_store import load_db_module
 
 from new_get_weather import WeatherQuery, ProviderFactory
 UNACCEPTABLE_WEATHER = {"rain", "snow", "thunder"}
 WEATHER_CACHE = {}
+# the same key requested by the other thread waits for the 1st request instead of fetching again
+WEATHER_IN_FLIGHT = {}
+WEATHER_CACHE_LOCK = threading.Lock()
+DEFAULT_WEATHER_JOBS = 4
+
+# the forecasts are kept on the disk across the runs until the provider updates them.
+# provider.get_update_interval_hours() is used if the provider has it, otherwise this table by the provider class name
+USE_WEATHER_DISK_CACHE = True
+WEATHER_CACHE_DIR = os.path.join(JsonCache.DEFAULT_CACHE_BASE_DIR, "weatherForecast")
+WEATHER_CACHE_NUM = 5000 # per provider
+WEATHER_CACHE_EXPIRE_HOURS = {
+    "openmeteo": 1,
+    "jma": 6,
+}
+DEFAULT_WEATHER_CACHE_EXPIRE_HOURS = 3
+WEATHER_DISK_CACHES = {}
+WEATHER_POINT_CLASSES = {}
+CANDIDATE_INDEX_CACHE = {}
+# filter and rank the trailheads as numpy columns if numpy is installed
+USE_TRAILHEAD_TABLE = np is not None
 
 SCRIPT_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -38,11 +72,8 @@ def get_ensured_path(path):
     return path
 
 def load_module(path):
-    path = get_ensured_path(path)
-    spec = importlib.util.spec_from_file_location("mod", path)
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)
-    return mod
+    # .py or .sqlite. e.g. db.MOUNTAINS
+    return load_db_module(get_ensured_path(path))
 
 
 def load_resources(mountainDb, userRoute, exclude):
@@ -58,6 +89,9 @@ def load_resources(mountainDb, userRoute, exclude):
         db.MOUNTAINS
     )
 
+    # built once here then the queries don't scan the db
+    get_candidate_index(db, routes)
+
     return db, routes, exclude_uuid, exclude_name
 
 
@@ -184,6 +218,111 @@ def bucket_altitude(alt):
     return int(round(alt / 100.0) * 100)
 
 
+def get_weather_cache_expire_hours(provider):
+    result = DEFAULT_WEATHER_CACHE_EXPIRE_HOURS
+
+    if hasattr(provider, "get_update_interval_hours"):
+        result = provider.get_update_interval_hours()
+    else:
+        name = provider.__class__.__name__.lower()
+        for provider_name, hours in WEATHER_CACHE_EXPIRE_HOURS.items():
+            if provider_name in name:
+                result = hours
+                break
+
+    return result
+
+
+def set_weather_disk_cache(enabled):
+    global USE_WEATHER_DISK_CACHE
+    USE_WEATHER_DISK_CACHE = enabled
+
+
+def get_weather_disk_cache(provider):
+    result = None
+
+    if USE_WEATHER_DISK_CACHE:
+        name = provider.__class__.__name__
+        with WEATHER_CACHE_LOCK:
+            if name not in WEATHER_DISK_CACHES:
+                # the responses are stored as plain json (see serialize_weather_response())
+                WEATHER_DISK_CACHES[name] = JsonCacheFactory.create(
+                    os.path.join(WEATHER_CACHE_DIR, name),
+                    get_weather_cache_expire_hours(provider),
+                    WEATHER_CACHE_NUM,
+                    format=CacheCodec.FORMAT_COMPACT
+                )
+            result = WEATHER_DISK_CACHES[name]
+
+    return result
+
+
+class CachedWeatherResponse:
+    # daily: {date: aggregated dict}, hourly: {date: [point]} as the provider's response
+    def __init__(self, daily, hourly):
+        self.daily = daily
+        self.hourly = hourly
+
+
+def weather_to_plain(value):
+    # json compatible copy e.g. the weather set as list, the datetime as iso format
+    if is_dataclass(value) and not isinstance(value, type):
+        value = asdict(value)
+
+    if isinstance(value, dict):
+        return {k: weather_to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [weather_to_plain(v) for v in value]
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    return value
+
+
+def get_weather_point_class(fields):
+    fields = tuple(fields)
+    if fields not in WEATHER_POINT_CLASSES:
+        WEATHER_POINT_CLASSES[fields] = make_dataclass("CachedWeatherPoint", fields)
+    return WEATHER_POINT_CLASSES[fields]
+
+
+def serialize_weather_response(response):
+    return {
+        "daily": [
+            [d.isoformat(), weather_to_plain(agg)]
+            for d, agg in response.daily.items()
+        ],
+        "hourly": [
+            [d.isoformat(), [weather_to_plain(p) for p in points]]
+            for d, points in (getattr(response, "hourly", None) or {}).items()
+        ],
+    }
+
+
+def deserialize_weather_response(data):
+    daily = {
+        date.fromisoformat(d): agg
+        for d, agg in data["daily"]
+    }
+
+    hourly = {}
+    for d, points in data["hourly"]:
+        hourly[date.fromisoformat(d)] = [
+            get_weather_point_class(point.keys())(**{
+                **point,
+                **({"time": datetime.fromisoformat(point["time"])} if "time" in point else {}),
+            })
+            for point in points
+        ]
+
+    return CachedWeatherResponse(daily, hourly)
+
+
+def get_weather_cache_key(key):
+    # ascii key of the cached_get_weather() key for the disk cache
+    return f"weather/{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()}"
+
+
 def cached_get_weather(provider, query, use_mesh=False, mesh_km=10):
     lat = query.lat
     lon = query.lon
@@ -205,19 +344,57 @@ def cached_get_weather(provider, query, use_mesh=False, mesh_km=10):
     )
 
     result = None
+    in_flight = None
+    is_owner = False
+
+    with WEATHER_CACHE_LOCK:
+        if key in WEATHER_CACHE:
+            result = WEATHER_CACHE[key]
+        elif key in WEATHER_IN_FLIGHT:
+            in_flight = WEATHER_IN_FLIGHT[key]
+        else:
+            in_flight = Future()
+            WEATHER_IN_FLIGHT[key] = in_flight
+            is_owner = True
+
+    if in_flight and not is_owner:
+        # raises the same exception as the 1st request
+        result = in_flight.result()
+    elif is_owner:
+        try:
+            disk_cache = get_weather_disk_cache(provider)
+            disk_key = get_weather_cache_key(key)
+            if disk_cache:
+                try:
+                    data = disk_cache.restoreFromCache(disk_key)
+                    result = deserialize_weather_response(data) if data else None
+                except:
+                    result = None
+
+            if result is None:
+                q = WeatherQuery(
+                    lat=lat,
+                    lon=lon,
+                    altitude=altitude,
+                    dates=query.dates,
+                    time_range=query.time_range
+                )
+                result = provider.get_weather(q)
+                if disk_cache:
+                    try:
+                        disk_cache.storeToCache(disk_key, serialize_weather_response(result))
+                    except:
+                        pass
 
-    if key in WEATHER_CACHE:
-        result = WEATHER_CACHE[key]
-    else:
-        q = WeatherQuery(
-            lat=lat,
-            lon=lon,
-            altitude=altitude,
-            dates=query.dates,
-            time_range=query.time_range
-        )
-        result = provider.get_weather(q)
-        WEATHER_CACHE[key] = result
+            with WEATHER_CACHE_LOCK:
+                WEATHER_CACHE[key] = result
+            in_flight.set_result(result)
+        except Exception as e:
+            in_flight.set_exception(e)
+            raise
+        finally:
+            with WEATHER_CACHE_LOCK:
+                WEATHER_IN_FLIGHT.pop(key, None)
 
     return result
 
@@ -341,66 +518,444 @@ def is_target_category(mflags, categories):
     return False
 
 
-def collect_candidates(db, routes, exclude_uuid, exclude_name, altitudeMin, altitudeMax, minRouteTime, maxRouteTime, minClimbTime, maxClimbTime, distanceMin, distanceMax, elevationMin, elevationMax, category):
-    selected = []
+class SortedColumn:
+    # (value, position) sorted by the value then a range filter is 2 bisects.
+    # None is kept apart since filter_range() passes it
 
-    categories = None
-    if category:
-        categories = category.split(",")
+    def __init__(self, values):
+        pairs = sorted(
+            (v, i)
+            for i, v in enumerate(values)
+            if v is not None
+        )
+        self.values = [v for v, _ in pairs]
+        self.positions = [i for _, i in pairs]
+        self.none_positions = [i for i, v in enumerate(values) if v is None]
 
-    for mountain_uuid, mountain in db.MOUNTAINS.items():
-        if is_mountain_excluded(
-            mountain_uuid,
-            mountain,
-            exclude_uuid,
-            exclude_name
-        ):
-            continue
+    def select(self, minv, maxv):
+        # None means not filtered
+        if minv is None and maxv is None:
+            return None
 
-        altitude = mountain["altitude"]
-        if not filter_range(
-            altitude,
-            altitudeMin,
-            altitudeMax
-        ):
-            continue
+        lo = 0 if minv is None else bisect_left(self.values, minv)
+        hi = len(self.values) if maxv is None else bisect_right(self.values, maxv)
 
-        if not is_target_category(mountain["flags"], categories):
-            continue
+        result = set(self.positions[lo:hi])
+        result.update(self.none_positions)
 
-        trailheads = []
+        return result
 
-        for tid, th in mountain["trailheads"].items():
-            filtered = filter_trailhead(
-                th, routes,
+
+def intersect_positions(*position_sets):
+    # None means not filtered
+    result = None
+
+    for positions in sorted(
+        (x for x in position_sets if x is not None),
+        key=len
+    ):
+        result = positions if result is None else result & positions
+
+    return result
+
+
+class TrailheadTable:
+    # numpy columns of all the trailheads then the filters are masks and the ranking is lexsort/argpartition.
+    # None is NaN and passes the filter as filter_range()
+
+    def __init__(self, trailhead_mountain, route_times, climb_times, distances, elevations, latitudes, longitudes, rank_route_times, sort_keys, unrouted_positions):
+        self.mountain = np.array(trailhead_mountain, dtype=np.int64)
+        self.route_time = self.to_column(route_times)
+        self.climb_time = self.to_column(climb_times)
+        self.distance = self.to_column(distances)
+        self.elevation = self.to_column(elevations)
+        self.latitude = self.to_column(latitudes)
+        self.longitude = self.to_column(longitudes)
+        self.rank_route_time = self.to_column(rank_route_times)
+        self.sort_key = self.to_column(sort_keys)
+        self.unrouted = self.to_mask(unrouted_positions, len(self.mountain))
+
+    @staticmethod
+    def to_column(values):
+        return np.array(
+            [np.nan if v is None else v for v in values],
+            dtype=np.float64
+        )
+
+    @staticmethod
+    def to_mask(positions, size):
+        result = np.zeros(size, dtype=bool)
+        if positions:
+            result[np.fromiter(positions, dtype=np.int64, count=len(positions))] = True
+        return result
+
+    @staticmethod
+    def range_mask(column, minv, maxv):
+        # None means not filtered
+        if minv is None and maxv is None:
+            return None
+
+        result = np.ones(len(column), dtype=bool)
+        if minv is not None:
+            result &= column >= minv
+        if maxv is not None:
+            result &= column <= maxv
+
+        return result | np.isnan(column)
+
+    def select(self, mountain_mask, minRouteTime, maxRouteTime, minClimbTime, maxClimbTime, distanceMin, distanceMax, elevationMin, elevationMax, limit=None, ranked=False):
+        # yields (mountain position, [trailhead positions ordered by route+climb time]) in the db order,
+        # or in the best route order if ranked or limit (up to limit mountains) is specified
+        mask = np.ones(len(self.mountain), dtype=bool)
+        for aMask in [
+            self.range_mask(self.route_time, minRouteTime, maxRouteTime),
+            self.range_mask(self.climb_time, minClimbTime, maxClimbTime),
+            self.range_mask(self.distance, distanceMin, distanceMax),
+            self.range_mask(self.elevation, elevationMin, elevationMax),
+        ]:
+            if aMask is not None:
+                mask &= aMask
+        mask |= self.unrouted
+        mask &= mountain_mask[self.mountain]
+
+        positions = np.flatnonzero(mask)
+        if not len(positions):
+            return
+
+        # lexsort is stable then the trailheads of the same time keep the db order
+        positions = positions[np.lexsort((self.sort_key[positions], self.mountain[positions]))]
+        mountains = self.mountain[positions]
+        starts = np.flatnonzero(np.r_[True, mountains[1:] != mountains[:-1]])
+        ends = np.r_[starts[1:], len(positions)]
+
+        groups = np.arange(len(starts))
+        if ranked or limit is not None:
+            best = self.rank_route_time[positions[starts]]
+            if limit is not None and limit < len(groups):
+                # the groups up to the limit-th best route then the ties are ordered by the db order
+                kth = np.partition(best, limit - 1)[limit - 1]
+                groups = np.flatnonzero(best <= kth)
+            groups = groups[np.lexsort((mountains[starts[groups]], best[groups]))]
+            if limit is not None:
+                groups = groups[:limit]
+
+        # the positions of a mountain are converted when it's pulled
+        for g in groups:
+            yield (
+                int(mountains[starts[g]]),
+                positions[starts[g]:ends[g]].tolist()
+            )
+
+
+class CandidateIndex:
+    # the mountains and the trailheads are numbered in the db order and
+    # each condition of collect_candidates() is resolved to the set of the numbers
+
+    def __init__(self, db, routes):
+        self.mountain_uuids = []
+        self.mountains = []
+        self.uuid_to_position = {}
+        self.name_to_positions = defaultdict(set)
+        self.flag_to_positions = defaultdict(set)
+        self.no_flag_positions = set()
+
+        self.trailheads = []
+        self.trailhead_mountain = []
+        self.trailhead_route_time = []
+        self.trailhead_sort_key = []
+        self.unrouted_positions = set()
+
+        altitudes = []
+        route_times = []
+        climb_times = []
+        distances = []
+        elevations = []
+        latitudes = []
+        longitudes = []
+
+        for mountain_uuid, mountain in db.MOUNTAINS.items():
+            m_pos = len(self.mountains)
+            self.mountain_uuids.append(mountain_uuid)
+            self.mountains.append(mountain)
+            self.uuid_to_position[mountain_uuid] = m_pos
+            if "mountain_name" in mountain:
+                self.name_to_positions[mountain["mountain_name"]].add(m_pos)
+            altitudes.append(mountain["altitude"])
+
+            flags = mountain["flags"]
+            if flags:
+                for flag in flags:
+                    self.flag_to_positions[flag].add(m_pos)
+            else:
+                self.no_flag_positions.add(m_pos)
+
+            for tid, th in mountain["trailheads"].items():
+                t_pos = len(self.trailheads)
+                self.trailheads.append(th)
+                self.trailhead_mountain.append(m_pos)
+
+                route_time = 9999 # should be worst trailhead
+                if th["trailhead_id"] in routes.USER_TOZANGUCHI:
+                    route_time = routes.USER_TOZANGUCHI[th["trailhead_id"]]["route_time_min"]
+                    route_times.append(route_time)
+                else:
+                    # filter_trailhead() doesn't filter it
+                    self.unrouted_positions.add(t_pos)
+                    route_times.append(None)
+
+                self.trailhead_route_time.append(route_time)
+                self.trailhead_sort_key.append(route_time + th["climb_time_min"])
+
+                climb_times.append(th.get("climb_time_min"))
+                distances.append(th.get("distance_min_km"))
+                elevations.append(th.get("elevation_gain_min"))
+                latitudes.append(th.get("latitude"))
+                longitudes.append(th.get("longitude"))
+
+        self.altitude = SortedColumn(altitudes)
+        self.route_time = SortedColumn(route_times)
+        self.climb_time = SortedColumn(climb_times)
+        self.distance = SortedColumn(distances)
+        self.elevation = SortedColumn(elevations)
+
+        self.table = None
+        if USE_TRAILHEAD_TABLE:
+            self.table = TrailheadTable(
+                self.trailhead_mountain,
+                route_times,
+                climb_times,
+                distances,
+                elevations,
+                latitudes,
+                longitudes,
+                self.trailhead_route_time,
+                self.trailhead_sort_key,
+                self.unrouted_positions
+            )
+
+    def select_category(self, categories):
+        # same as is_target_category(): substring of the flags and the mountain without flags is always target
+        if not categories:
+            return None
+
+        result = set(self.no_flag_positions)
+
+        for flag, positions in self.flag_to_positions.items():
+            if any(category in flag for category in categories):
+                result.update(positions)
+
+        return result
+
+    def select_excluded(self, exclude_uuid, exclude_name):
+        result = set()
+
+        for mountain_uuid in exclude_uuid:
+            if mountain_uuid in self.uuid_to_position:
+                result.add(self.uuid_to_position[mountain_uuid])
+
+        for name in exclude_name:
+            result.update(self.name_to_positions.get(name, ()))
+
+        return result
+
+    def select_by_sets(self, mountain_positions, excluded, minRouteTime, maxRouteTime, minClimbTime, maxClimbTime, distanceMin, distanceMax, elevationMin, elevationMax, limit=None, ranked=False):
+        # same as TrailheadTable.select() without numpy
+        trailhead_positions = intersect_positions(
+            self.route_time.select(minRouteTime, maxRouteTime),
+            self.climb_time.select(minClimbTime, maxClimbTime),
+            self.distance.select(distanceMin, distanceMax),
+            self.elevation.select(elevationMin, elevationMax)
+        )
+        if trailhead_positions is None:
+            trailhead_positions = range(len(self.trailheads))
+        else:
+            trailhead_positions = sorted(trailhead_positions | self.unrouted_positions)
+
+        # the trailhead positions are in the db order then they are grouped by the mountain as is
+        grouped = {}
+        for t_pos in trailhead_positions:
+            m_pos = self.trailhead_mountain[t_pos]
+            if m_pos in excluded:
+                continue
+            if mountain_positions is not None and m_pos not in mountain_positions:
+                continue
+            if m_pos in grouped:
+                grouped[m_pos].append(t_pos)
+            else:
+                grouped[m_pos] = [t_pos]
+
+        if not ranked and limit is None:
+            for m_pos, positions in grouped.items():
+                positions.sort(key=lambda x: self.trailhead_sort_key[x])
+                yield m_pos, positions
+            return
+
+        # the best route is the route time of the 1st trailhead (min() returns the 1st one of the ties as the stable sort).
+        # the mountains are popped from the heap on demand then the trailheads are sorted for the pulled mountains only
+        heap = [
+            (
+                self.trailhead_route_time[min(positions, key=lambda x: self.trailhead_sort_key[x])],
+                m_pos
+            )
+            for m_pos, positions in grouped.items()
+        ]
+        heapq.heapify(heap)
+
+        n = 0
+        while heap and (limit is None or n < limit):
+            _, m_pos = heapq.heappop(heap)
+            positions = grouped[m_pos]
+            positions.sort(key=lambda x: self.trailhead_sort_key[x])
+            yield m_pos, positions
+            n += 1
+
+    def query(self, *args, **kwargs):
+        return list(self.iter_query(*args, **kwargs))
+
+    def iter_query(self, exclude_uuid, exclude_name, altitudeMin, altitudeMax, minRouteTime, maxRouteTime, minClimbTime, maxClimbTime, distanceMin, distanceMax, elevationMin, elevationMax, categories, limit=None, ranked=False):
+        mountain_positions = intersect_positions(
+            self.altitude.select(altitudeMin, altitudeMax),
+            self.select_category(categories)
+        )
+        excluded = self.select_excluded(exclude_uuid, exclude_name)
+
+        if self.table is not None:
+            if mountain_positions is None:
+                mountain_mask = np.ones(len(self.mountains), dtype=bool)
+            else:
+                mountain_mask = TrailheadTable.to_mask(mountain_positions, len(self.mountains))
+            if excluded:
+                mountain_mask &= ~TrailheadTable.to_mask(excluded, len(self.mountains))
+
+            groups = self.table.select(
+                mountain_mask,
                 minRouteTime, maxRouteTime,
                 minClimbTime, maxClimbTime,
                 distanceMin, distanceMax,
-                elevationMin, elevationMax
+                elevationMin, elevationMax,
+                limit, ranked
             )
-            if filtered:
-                trailheads.append(filtered)
-
-        if trailheads:
-            trailheads.sort(
-                key=lambda x: (
-                    x["route_time"] +
-                    x["data"]["climb_time_min"]
-                )
+        else:
+            groups = self.select_by_sets(
+                mountain_positions, excluded,
+                minRouteTime, maxRouteTime,
+                minClimbTime, maxClimbTime,
+                distanceMin, distanceMax,
+                elevationMin, elevationMax,
+                limit, ranked
             )
 
-            selected.append(
+        # the dicts are created for the survivors only
+        for m_pos, positions in groups:
+            trailheads = [
                 {
-                    "best_route": trailheads[0]["route_time"],
-                    "mountain": mountain,
-                    "trailheads": trailheads
+                    "route_time": self.trailhead_route_time[t_pos],
+                    "data": self.trailheads[t_pos]
                 }
-            )
+                for t_pos in positions
+            ]
+
+            yield {
+                "best_route": trailheads[0]["route_time"],
+                "mountain": self.mountains[m_pos],
+                "trailheads": trailheads
+            }
+
+
+def get_candidate_index(db, routes):
+    # db and routes are kept in the cache then their ids aren't reused
+    key = (id(db), id(routes))
+
+    if key in CANDIDATE_INDEX_CACHE:
+        result = CANDIDATE_INDEX_CACHE[key][2]
+    else:
+        result = CandidateIndex(db, routes)
+        CANDIDATE_INDEX_CACHE[key] = (db, routes, result)
+
+    return result
+
+
+def collect_candidates(db, routes, exclude_uuid, exclude_name, altitudeMin, altitudeMax, minRouteTime, maxRouteTime, minClimbTime, maxClimbTime, distanceMin, distanceMax, elevationMin, elevationMax, category, top=None):
+    # top: the best top mountains ordered by best_route instead of all the mountains in the db order
+    categories = None
+    if category:
+        categories = category.split(",")
+
+    return get_candidate_index(db, routes).query(
+        exclude_uuid,
+        exclude_name,
+        altitudeMin,
+        altitudeMax,
+        minRouteTime,
+        maxRouteTime,
+        minClimbTime,
+        maxClimbTime,
+        distanceMin,
+        distanceMax,
+        elevationMin,
+        elevationMax,
+        categories,
+        top
+    )
+
+
+class LazyCandidates:
+    # the candidates are created on demand and kept then the next iteration (e.g. the next date) reuses them
+
+    def __init__(self, generator):
+        self._generator = generator
+        self._items = []
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i == len(self._items):
+                item = next(self._generator, None)
+                if item is None:
+                    break
+                self._items.append(item)
+            yield self._items[i]
+            i += 1
+
+    def head(self, n):
+        return list(itertools.islice(self, n))
+
+
+def iter_candidates(db, routes, exclude_uuid, exclude_name, altitudeMin, altitudeMax, minRouteTime, maxRouteTime, minClimbTime, maxClimbTime, distanceMin, distanceMax, elevationMin, elevationMax, category):
+    # same candidates as collect_candidates() + sort_candidates() but only the pulled ones are created
+    categories = None
+    if category:
+        categories = category.split(",")
+
+    return LazyCandidates(
+        get_candidate_index(db, routes).iter_query(
+            exclude_uuid,
+            exclude_name,
+            altitudeMin,
+            altitudeMax,
+            minRouteTime,
+            maxRouteTime,
+            minClimbTime,
+            maxClimbTime,
+            distanceMin,
+            distanceMax,
+            elevationMin,
+            elevationMax,
+            categories,
+            ranked=True
+        )
+    )
 
-    return selected
 
+def filter_candidates_by_weather(selected, db, routes, weatherProvider, target_date, dates, pace, startHour, topN, mesh_km, jobs=1):
+    if jobs > 1:
+        return filter_candidates_by_weather_concurrently(
+            selected, weatherProvider,
+            target_date, dates,
+            pace, startHour,
+            topN, mesh_km, jobs
+        )
 
-def filter_candidates_by_weather(selected, db, routes, weatherProvider, target_date, dates, pace, startHour, topN, mesh_km):
     result = []
     provider = ProviderFactory.create(weatherProvider)
     preliminary = []
@@ -443,6 +998,94 @@ def filter_candidates_by_weather(selected, db, routes, weatherProvider, target_d
                     "mountain": mountain,
                     "trailheads": trailheads
                 })
+        else:
+            # the rest of the lazy candidates are not created
+            break
+
+    return result
+
+
+def submit_weather_checks(executor, provider, row, target_date, dates, pace, startHour, mesh_km):
+    # the summit and all the trailheads are queried at once. the trailheads are discarded if the summit is NG
+    mountain = row["mountain"]
+
+    max_climb = max(x["data"]["climb_time_min"] for x in row["trailheads"])
+    duration_hour = max(1, int((max_climb * pace) / 60) + 1)
+
+    summit = executor.submit(
+        summit_weather_ok,
+        provider, mountain,
+        target_date, dates,
+        startHour, duration_hour
+    )
+
+    trailheads = [
+        executor.submit(
+            trailhead_weather_ok,
+            provider,
+            mountain,
+            th["data"],
+            target_date,
+            dates,
+            pace,
+            startHour,
+            mesh_km
+        )
+        for th in row["trailheads"]
+    ]
+
+    return row, summit, trailheads
+
+
+def filter_candidates_by_weather_concurrently(selected, weatherProvider, target_date, dates, pace, startHour, topN, mesh_km, jobs):
+    # same result as filter_candidates_by_weather(). the candidates which may be needed for topN are checked concurrently
+    # and they are judged in the candidate order
+    result = []
+    provider = ProviderFactory.create(weatherProvider)
+    candidates = iter(selected)
+    pending = []
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        while len(result) < topN:
+            # all of the in-flight candidates are needed if they pass
+            while len(pending) < topN - len(result):
+                row = next(candidates, None)
+                if row is None:
+                    break
+                pending.append(
+                    submit_weather_checks(
+                        executor, provider, row,
+                        target_date, dates,
+                        pace, startHour, mesh_km
+                    )
+                )
+
+            if not pending:
+                break
+
+            row, summit, trailhead_futures = pending.pop(0)
+
+            if not summit.result():
+                for future in trailhead_futures:
+                    future.cancel()
+                continue
+
+            trailheads = [
+                th
+                for th, future in zip(row["trailheads"], trailhead_futures)
+                if future.result()
+            ]
+
+            if trailheads:
+                result.append({
+                    "best_route": row["best_route"],
+                    "mountain": row["mountain"],
+                    "trailheads": trailheads
+                })
+    finally:
+        # topN is reached. the queued checks are cancelled and the running ones are left to finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
 
     return result
 
@@ -537,6 +1180,8 @@ def parse_args():
     parser.add_argument("--weatherProvider", default="openmeteo")
     parser.add_argument("--top", type=int, default=10, help='Specify the number of mountain candidates')
     parser.add_argument("--mesh-km", type=float, default=5.0)
+    parser.add_argument("--noWeatherCache", action="store_true", help='Fetch the forecasts without the disk cache')
+    parser.add_argument("--weatherJobs", type=int, default=DEFAULT_WEATHER_JOBS, help='Specify the number of concurrent weather queries (1: sequential)')
 
     parser.add_argument('-nd', '--urlOnly', action='store_true', default=False, help='specify if you want to print url only')
     parser.add_argument('-n', '--numOpen', action='store', type=int, default=3, help='specify if you want to filter the opening article')
@@ -548,12 +1193,14 @@ def parse_args():
 def main():
     args = parse_args()
 
+    set_weather_disk_cache(not args.noWeatherCache)
+
     minRouteTime = get_min_from_hhmm(args.minRouteTime)
     maxRouteTime = get_min_from_hhmm(args.maxRouteTime)
     minClimbTime = get_min_from_hhmm(args.minClimbTime)
     maxClimbTime = get_min_from_hhmm(args.maxClimbTime)
 
-    recUtil = MountainRecordUtil()
+    recUtil = MountainRecordUtil(staleWhileRevalidate=True)
     today = datetime.now().date()
 
     db, routes, exclude_uuid, exclude_name = load_resources(
@@ -561,7 +1208,7 @@ def main():
         args.userRoute,
         args.exclude
     )
-    selected = collect_candidates(
+    selected = iter_candidates(
         db,
         routes,
         exclude_uuid,
@@ -578,13 +1225,12 @@ def main():
         args.elevationMax,
         args.category
     )
-    sort_candidates(selected)
 
     _selected = []
     _selected_uuids = set()
     if args.nw:
         # case : NOT filter by weather
-        _selected = selected[:args.top]
+        _selected = selected.head(args.top)
         for _ in _selected:
             _selected_uuids.add( _["mountain"]["mountain_uuid"])
     else:
@@ -606,7 +1252,8 @@ def main():
                 args.pace,
                 args.startHour,
                 args.top,
-                args.mesh_km
+                args.mesh_km,
+                args.weatherJobs
             )
 
             for _ in acceptable_weather_filtered_mountains: